@@ -0,0 +1,37 @@
+"""
+Celery application for Mukurugenzi E-commerce Platform
+
+Settings are read from Django's settings module using the ``CELERY_`` prefix.
+Start a worker with:
+
+    celery -A Mukurugenzi_Ecommerce_Platform worker -l info
+
+Workers share payment attempts, stock holds and the callback and email
+queues with the web processes through the cache, so a worker refuses to
+start on a per-process LocMem cache (set REDIS_URL, or run tasks eagerly
+with CELERY_TASK_ALWAYS_EAGER).
+"""
+
+import os
+
+from celery import Celery
+from celery.signals import worker_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Mukurugenzi_Ecommerce_Platform.settings')
+
+app = Celery('Mukurugenzi_Ecommerce_Platform')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def require_shared_cache(**kwargs):
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.endswith('LocMemCache') and not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        raise ImproperlyConfigured(
+            'Celery workers need a cache shared with the web processes; '
+            'set REDIS_URL or CELERY_TASK_ALWAYS_EAGER'
+        )
@@ -88,6 +88,10 @@ DATABASES = {
 # Custom User Model
 AUTH_USER_MODEL = 'ecommerce.User'
 
+AUTHENTICATION_BACKENDS = [
+    'ecommerce.backends.EmailOrUsernameBackend',
+]
+
 # Media Files (for images and videos)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -170,12 +174,23 @@ MPESA_CONSUMER_SECRET = config('MPESA_CONSUMER_SECRET', default='')
 MPESA_SHORTCODE = config('MPESA_SHORTCODE', default='174379')
 MPESA_PASSKEY = config('MPESA_PASSKEY', default='')
 MPESA_CALLBACK_URL = config('MPESA_CALLBACK_URL', default='https://yourdomain.com/payment/mpesa/callback/')
+MPESA_BASE_URL = config('MPESA_BASE_URL', default='')  # overrides the environment URL, e.g. for run_mpesa_stub
+MPESA_TIMEOUT = (3.05, 15)  # (connect, read) seconds
 
 
 # PayPal Configuration
 PAYPAL_MODE = config('PAYPAL_MODE', default='sandbox')  # sandbox or live
 PAYPAL_CLIENT_ID = config('PAYPAL_CLIENT_ID', default='')
 PAYPAL_CLIENT_SECRET = config('PAYPAL_CLIENT_SECRET', default='')
+PAYPAL_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+
+
+# Exchange Rates (1 KES = rate <currency>)
+EXCHANGE_RATES = {
+    'USD': config('KES_USD_RATE', default='0.0078'),
+}
+EXCHANGE_RATE_API_URL = config('EXCHANGE_RATE_API_URL', default='')  # JSON with a "rates" object, base KES
+EXCHANGE_RATE_REFRESH_SECONDS = 60 * 60
 
 
 # Django REST Framework
@@ -211,11 +226,60 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)  # run inline without a worker
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-mpesa-payments': {
+        'task': 'ecommerce.tasks.reconcile_pending_mpesa_payments',
+        'schedule': 5 * 60,
+    },
+    'refresh-exchange-rates': {
+        'task': 'ecommerce.tasks.refresh_currency_rates',
+        'schedule': EXCHANGE_RATE_REFRESH_SECONDS,
+    },
+    'release-expired-stock-holds': {
+        'task': 'ecommerce.tasks.release_expired_stock_holds',
+        'schedule': 5 * 60,
+    },
+}
+
+
+# Checkout stock holds (seconds a reservation lasts)
+INVENTORY_HOLD_SECONDS = 15 * 60
+
+
+# Recommendations (written by `manage.py build_recommendations`)
+RECOMMENDATIONS_PATH = os.path.join(BASE_DIR, 'data', 'recommendations.json')
+
+
+# Newsletter campaign delivery logs (written by `manage.py send_newsletter`)
+NEWSLETTER_LOG_DIR = os.path.join(BASE_DIR, 'data', 'newsletters')
+
+
+# Cache Configuration (Redis in production, or in development when REDIS_URL is set)
+REDIS_URL = config('REDIS_URL', default='' if DEBUG else 'redis://127.0.0.1:6379/1')
+
+# Sessions, payment attempts, stock holds and the task queues need a cache
+# every web and Celery process shares; the default LocMem cache is per process
+SHARED_CACHE = bool(REDIS_URL)
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
 
 
 # Session Configuration
 SESSION_COOKIE_AGE = 86400 * 30  # 30 days
 SESSION_SAVE_EVERY_REQUEST = False
+if SHARED_CACHE:
+    SESSION_ENGINE = 'ecommerce.sessions'  # cache first, database row written lazily
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'  # every save reaches the database
+SESSION_DB_PERSIST_INTERVAL = 5 * 60  # seconds between database writes per session (0 = every save)
 
 
 # Security Settings (for production)
@@ -260,6 +324,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'ecommerce': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'store': {  # Replace with your app name
             'handlers': ['file', 'console'],
             'level': 'DEBUG',
@@ -282,13 +351,3 @@ LOGOUT_REDIRECT_URL = 'index'
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
-
-
-# Cache Configuration (for production)
-if not DEBUG:
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-            'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
-        }
-    }
@@ -3,12 +3,18 @@ Mukurugenzi E-commerce Platform - Django Admin Configuration
 Professional admin interface for managing products, videos, orders, and more
 """
 
+from decimal import Decimal
+from functools import partial
+
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
-from django.db.models import Count, Sum
+from django.db.models import Count, F, Sum
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import *
+from .cart import get_cart_totals
+from .ratings import invalidate_rating_summaries
 
 
 # ============================================================================
@@ -52,9 +58,13 @@ class CountyAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_station_count=Count('delivery_stations'))
+
     def station_count(self, obj):
-        return obj.delivery_stations.count()
+        return obj._station_count
     station_count.short_description = 'Delivery Stations'
+    station_count.admin_order_field = '_station_count'
 
 
 @admin.register(DeliveryStation)
@@ -101,6 +111,7 @@ class InternationalShippingZoneAdmin(admin.ModelAdmin):
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug', 'parent', 'order', 'product_count', 'is_active', 'created_at']
+    list_select_related = ['parent']  # nullable, so not followed by default
     list_filter = ['is_active', 'parent', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -120,9 +131,13 @@ class CategoryAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_product_count=Count('products'))
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj._product_count
     product_count.short_description = 'Products'
+    product_count.admin_order_field = '_product_count'
 
     def category_image(self, obj):
         if obj.image:
@@ -139,9 +154,13 @@ class BrandAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'brand_logo']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_product_count=Count('products'))
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj._product_count
     product_count.short_description = 'Products'
+    product_count.admin_order_field = '_product_count'
 
     def brand_logo(self, obj):
         if obj.logo:
@@ -177,6 +196,7 @@ class ProductVariantInline(admin.TabularInline):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'sku', 'product_type', 'category', 'brand', 'base_price', 
                    'variant_count', 'is_active', 'is_featured', 'created_at']
+    list_select_related = ['category', 'brand']
     list_filter = ['product_type', 'category', 'brand', 'is_active', 'is_featured', 'created_at']
     search_fields = ['name', 'sku', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -208,9 +228,13 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_variant_count=Count('variants'))
+
     def variant_count(self, obj):
-        return obj.variants.count()
+        return obj._variant_count
     variant_count.short_description = 'Variants'
+    variant_count.admin_order_field = '_variant_count'
 
 
 @admin.register(ProductImage)
@@ -290,9 +314,13 @@ class VideoGenreAdmin(admin.ModelAdmin):
     search_fields = ['name']
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_video_count=Count('videos'))
+
     def video_count(self, obj):
-        return obj.videos.count()
+        return obj._video_count
     video_count.short_description = 'Videos'
+    video_count.admin_order_field = '_video_count'
 
 
 class VideoSeasonInline(admin.TabularInline):
@@ -375,9 +403,13 @@ class VideoSeasonAdmin(admin.ModelAdmin):
     search_fields = ['video__title', 'title']
     inlines = [VideoEpisodeInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_episode_count=Count('episodes'))
+
     def episode_count(self, obj):
-        return obj.episodes.count()
+        return obj._episode_count
     episode_count.short_description = 'Episodes'
+    episode_count.admin_order_field = '_episode_count'
 
 
 @admin.register(VideoEpisode)
@@ -485,6 +517,7 @@ class CartItemInline(admin.TabularInline):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['cart_owner', 'total_items', 'subtotal', 'created_at', 'updated_at']
+    list_select_related = ['user']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'session_key']
     readonly_fields = ['created_at', 'updated_at', 'total_items', 'subtotal']
@@ -496,6 +529,28 @@ class CartAdmin(admin.ModelAdmin):
         return f"Guest ({obj.session_key[:8]}...)"
     cart_owner.short_description = 'Owner'
 
+    def get_queryset(self, request):
+        # Totals for the whole page come from one grouped query and can be sorted
+        return super().get_queryset(request).annotate(
+            _total_items=Sum('items__quantity'),
+            _subtotal=Sum(F('items__quantity') * F('items__product_variant__price')),
+        )
+
+    # Carts loaded without the annotation fall back to the stored counters
+    def total_items(self, obj):
+        if hasattr(obj, '_total_items'):
+            return obj._total_items or 0
+        return get_cart_totals(obj)[0]
+    total_items.short_description = 'Total items'
+    total_items.admin_order_field = '_total_items'
+
+    def subtotal(self, obj):
+        if hasattr(obj, '_subtotal'):
+            return obj._subtotal or Decimal('0')
+        return get_cart_totals(obj)[1]
+    subtotal.short_description = 'Subtotal'
+    subtotal.admin_order_field = '_subtotal'
+
 
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
@@ -619,6 +674,25 @@ class ProductReviewAdmin(admin.ModelAdmin):
     search_fields = ['product__name', 'user__username', 'title', 'review']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [ReviewImageInline]
+    actions = ['approve_reviews', 'unapprove_reviews']
+
+    def _set_approval(self, request, queryset, is_approved):
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        updated = queryset.update(is_approved=is_approved)
+        # Bulk update skips signals, so retire the affected summaries directly;
+        # the next read rebuilds them from the committed reviews
+        transaction.on_commit(partial(invalidate_rating_summaries, product_ids))
+        return updated
+
+    def approve_reviews(self, request, queryset):
+        updated = self._set_approval(request, queryset, True)
+        self.message_user(request, f'{updated} review(s) approved.')
+    approve_reviews.short_description = 'Approve selected reviews'
+
+    def unapprove_reviews(self, request, queryset):
+        updated = self._set_approval(request, queryset, False)
+        self.message_user(request, f'{updated} review(s) unapproved.')
+    unapprove_reviews.short_description = 'Unapprove selected reviews'
 
 
 # ============================================================================
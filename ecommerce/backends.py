@@ -0,0 +1,43 @@
+"""
+Mukurugenzi E-commerce Platform - Authentication Backends
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+UserModel = get_user_model()
+
+# Email logins filter on email__iexact, i.e. UPPER(email) on PostgreSQL;
+# created by the build_user_indexes command
+EMAIL_INDEX_NAME = 'ecommerce_user_email_upper_idx'
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """
+    Log in with either a username or an email address.
+
+    The exact username lookup runs first, so a username that contains '@'
+    still works; only then is the email tried, as a separate query that can
+    use the UPPER(email) index. An OR of the two would scan the user table.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            user = None
+            if '@' in username:
+                user = UserModel._default_manager.filter(email__iexact=username).order_by('id').first()
+
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user (#20760).
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
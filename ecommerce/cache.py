@@ -0,0 +1,113 @@
+"""
+Mukurugenzi E-commerce Platform - Catalog Caching
+Cached homepage data blocks, invalidated from model signals (see signals.py)
+"""
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .categories import get_category_tree
+from .models import Banner, Product, Video
+
+
+HOMEPAGE_CACHE_TIMEOUT = 60 * 60 * 6  # 6 hours; signals handle freshness
+
+HOMEPAGE_BANNERS_KEY = 'homepage:banners'
+HOMEPAGE_FEATURED_PRODUCTS_KEY = 'homepage:featured_products'
+HOMEPAGE_NEW_PRODUCTS_KEY = 'homepage:new_products'
+HOMEPAGE_FEATURED_VIDEOS_KEY = 'homepage:featured_videos'
+
+# Which homepage blocks depend on which models
+HOMEPAGE_BLOCK_DEPENDENCIES = {
+    'Banner': [HOMEPAGE_BANNERS_KEY],
+    'Product': [HOMEPAGE_FEATURED_PRODUCTS_KEY, HOMEPAGE_NEW_PRODUCTS_KEY],
+    'ProductImage': [HOMEPAGE_FEATURED_PRODUCTS_KEY, HOMEPAGE_NEW_PRODUCTS_KEY],
+    'Video': [HOMEPAGE_FEATURED_VIDEOS_KEY],
+    'Category': [HOMEPAGE_FEATURED_PRODUCTS_KEY, HOMEPAGE_NEW_PRODUCTS_KEY],
+}
+
+
+# ============================================================================
+# HOMEPAGE BLOCK BUILDERS
+# ============================================================================
+
+def _build_banners():
+    """All active banners; the date window is applied per request"""
+    return list(Banner.objects.filter(is_active=True).order_by('order'))
+
+
+def _build_featured_products():
+    return list(
+        Product.objects.filter(
+            is_active=True,
+            is_featured=True
+        ).select_related('category', 'brand').prefetch_related('images')[:8]
+    )
+
+
+def _build_new_products():
+    """
+    Latest 12 active products.
+
+    The old "last 30 days, else latest 12" fallback always yielded the
+    12 newest products, so a single query covers both cases.
+    """
+    return list(
+        Product.objects.filter(
+            is_active=True
+        ).select_related('category', 'brand').prefetch_related('images').order_by('-created_at')[:12]
+    )
+
+
+def _build_featured_videos():
+    return list(
+        Video.objects.filter(
+            is_active=True,
+            is_featured=True
+        ).prefetch_related('genres')[:6]
+    )
+
+
+HOMEPAGE_BLOCK_BUILDERS = {
+    HOMEPAGE_BANNERS_KEY: _build_banners,
+    HOMEPAGE_FEATURED_PRODUCTS_KEY: _build_featured_products,
+    HOMEPAGE_NEW_PRODUCTS_KEY: _build_new_products,
+    HOMEPAGE_FEATURED_VIDEOS_KEY: _build_featured_videos,
+}
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def get_homepage_blocks():
+    """Return all homepage blocks, building only the ones missing from cache"""
+
+    blocks = cache.get_many(HOMEPAGE_BLOCK_BUILDERS.keys())
+    missing = {}
+    for key, builder in HOMEPAGE_BLOCK_BUILDERS.items():
+        if key not in blocks:
+            blocks[key] = missing[key] = builder()
+    if missing:
+        cache.set_many(missing, HOMEPAGE_CACHE_TIMEOUT)
+
+    now = timezone.now()
+    banners = [
+        banner for banner in blocks[HOMEPAGE_BANNERS_KEY]
+        if banner.start_date <= now and (banner.end_date is None or banner.end_date >= now)
+    ][:5]
+
+    return {
+        'banners': banners,
+        'featured_products': blocks[HOMEPAGE_FEATURED_PRODUCTS_KEY],
+        'new_products': blocks[HOMEPAGE_NEW_PRODUCTS_KEY],
+        'featured_videos': blocks[HOMEPAGE_FEATURED_VIDEOS_KEY],
+        'categories': get_category_tree().menu(limit=5),
+    }
+
+
+def invalidate_homepage_blocks(model_name):
+    """Drop the homepage blocks that depend on the given model"""
+    keys = HOMEPAGE_BLOCK_DEPENDENCIES.get(model_name)
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,286 @@
+"""
+Mukurugenzi E-commerce Platform - Cart Helpers
+Lazy carts: nothing is written until a shopper actually adds an item
+
+Logged-in users keep a database Cart, created on first add. Anonymous carts
+live in the session payload as {variant_id: quantity}, so browsing (and bot
+traffic) never creates session or cart rows; with the signed_cookies session
+engine they need no server-side storage at all.
+"""
+
+import uuid
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Cart, CartItem, ProductVariant
+
+
+SESSION_CART_KEY = 'cart'
+
+CART_VERSION_KEY = 'cart:{}:version'
+CART_ITEMS_KEY = 'cart:{}:{}:items'
+CART_SUBTOTAL_KEY = 'cart:{}:{}:subtotal_cents'
+CART_TOTALS_TIMEOUT = 60 * 60  # bounds the life of a counter that drifted
+
+
+class SessionCartItem:
+    """CartItem look-alike for templates rendering a session cart"""
+
+    def __init__(self, variant, quantity):
+        self.id = variant.id
+        self.product_variant = variant
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        return self.product_variant.price * self.quantity
+
+
+class SessionCart:
+    """Anonymous cart stored in ``request.session``"""
+
+    is_persisted = False
+    user = None
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def _lines(self):
+        return self.session.get(SESSION_CART_KEY, {})
+
+    def _save(self, lines):
+        if lines:
+            self.session[SESSION_CART_KEY] = lines
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+        self.__dict__.pop('_items', None)
+
+    def get_quantity(self, variant_id):
+        return self._lines.get(str(variant_id), 0)
+
+    def set_quantity(self, variant_id, quantity):
+        lines = dict(self._lines)
+        lines[str(variant_id)] = quantity
+        self._save(lines)
+
+    def remove(self, variant_id):
+        lines = dict(self._lines)
+        removed = lines.pop(str(variant_id), None) is not None
+        self._save(lines)
+        return removed
+
+    def clear(self):
+        self._save({})
+
+    @property
+    def total_items(self):
+        return sum(self._lines.values())
+
+    @property
+    def items(self):
+        """Cart lines with their variants loaded in one query"""
+        if '_items' not in self.__dict__:
+            lines = self._lines
+            variants = ProductVariant.objects.filter(
+                id__in=lines.keys(), is_active=True
+            ).select_related(
+                'product', 'size', 'color'
+            ).prefetch_related('product__images').in_bulk()
+            self.__dict__['_items'] = [
+                SessionCartItem(variants[int(variant_id)], quantity)
+                for variant_id, quantity in lines.items()
+                if int(variant_id) in variants
+            ]
+        return self.__dict__['_items']
+
+    @property
+    def subtotal(self):
+        return sum((item.total_price for item in self.items), Decimal('0'))
+
+
+# ============================================================================
+# STORED CART TOTALS
+# ============================================================================
+
+# Counters are stored under a per-cart version. Invalidating a cart moves it
+# to a new version, so a rebuild that read the database before the change
+# writes to the abandoned version and can never overwrite newer counters.
+# Rebuilds also only add missing counters, never replace live ones.
+
+def _to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal('1')))
+
+
+def _versions(cart_ids):
+    """Map cart id -> current counter version, starting one where missing"""
+
+    keys = {CART_VERSION_KEY.format(cart_id): cart_id for cart_id in cart_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, cart_id in keys.items():
+        if cart_id not in versions:
+            version = uuid.uuid4().hex
+            cache.add(key, version, None)
+            versions[cart_id] = cache.get(key, version)
+    return versions
+
+
+def refresh_cart_totals(cart_ids):
+    """Recompute item count and subtotal for the given carts in one grouped query"""
+
+    cart_ids = set(cart_ids)
+    versions = _versions(cart_ids)  # before reading, so a concurrent change wins
+    totals = dict.fromkeys(cart_ids, (0, 0))
+    rows = CartItem.objects.filter(cart_id__in=cart_ids).values('cart_id').annotate(
+        items=Sum('quantity'),
+        subtotal=Sum(F('quantity') * F('product_variant__price'))
+    )
+    for row in rows:
+        totals[row['cart_id']] = (row['items'] or 0, _to_cents(row['subtotal'] or 0))
+
+    for cart_id, (items, cents) in totals.items():
+        cache.add(CART_ITEMS_KEY.format(cart_id, versions[cart_id]), items, CART_TOTALS_TIMEOUT)
+        cache.add(CART_SUBTOTAL_KEY.format(cart_id, versions[cart_id]), cents, CART_TOTALS_TIMEOUT)
+    return totals
+
+
+def get_cart_totals_many(cart_ids):
+    """Map cart id -> (item count, subtotal) from the stored counters"""
+
+    versions = _versions(set(cart_ids))
+    keys = {
+        cart_id: (CART_ITEMS_KEY.format(cart_id, version), CART_SUBTOTAL_KEY.format(cart_id, version))
+        for cart_id, version in versions.items()
+    }
+    cached = cache.get_many([key for pair in keys.values() for key in pair])
+
+    totals, missing = {}, []
+    for cart_id, (items_key, subtotal_key) in keys.items():
+        items = cached.get(items_key)
+        cents = cached.get(subtotal_key)
+        if items is None or cents is None:
+            missing.append(cart_id)
+        else:
+            totals[cart_id] = (items, cents)
+    if missing:
+        totals.update(refresh_cart_totals(missing))
+
+    return {
+        cart_id: (items, Decimal(cents) / 100)
+        for cart_id, (items, cents) in totals.items()
+    }
+
+
+def get_cart_totals(cart):
+    """(item count, subtotal) for a database Cart or a SessionCart"""
+    if isinstance(cart, SessionCart):
+        return cart.total_items, cart.subtotal
+    if cart is None:
+        return 0, Decimal('0')
+    return get_cart_totals_many([cart.id])[cart.id]
+
+
+def adjust_cart_totals(cart_id, quantity_delta, amount_delta):
+    """Atomically shift a cart's stored counters by the given deltas"""
+    if not quantity_delta and not amount_delta:
+        return
+    version = _versions([cart_id])[cart_id]
+    try:
+        cache.incr(CART_ITEMS_KEY.format(cart_id, version), quantity_delta)
+        cache.incr(CART_SUBTOTAL_KEY.format(cart_id, version), _to_cents(amount_delta))
+    except ValueError:
+        # Counters evicted or never built: retire this version so that a
+        # rebuild already in flight cannot store totals missing this change
+        invalidate_cart_totals([cart_id])
+
+
+def invalidate_cart_totals(cart_ids):
+    """Move carts to a fresh version; the next read rebuilds their counters"""
+    cache.set_many({CART_VERSION_KEY.format(cart_id): uuid.uuid4().hex for cart_id in cart_ids}, None)
+
+
+# ============================================================================
+# CART LOOKUP
+# ============================================================================
+
+def get_cart(request, create=False):
+    """
+    The current shopper's cart.
+
+    Anonymous visitors always get a SessionCart. For logged-in users the
+    database Cart is returned, or None if they have none and ``create`` is
+    False.
+    """
+
+    if not request.user.is_authenticated:
+        return SessionCart(request.session)
+    if create:
+        return Cart.objects.get_or_create(user=request.user)[0]
+    return Cart.objects.filter(user=request.user).first()
+
+
+def get_cart_count(request):
+    """Item count for the header badge without creating a cart"""
+
+    if not request.user.is_authenticated:
+        return SessionCart(request.session).total_items
+    cart_id = Cart.objects.filter(user=request.user).values_list('id', flat=True).first()
+    if cart_id is None:
+        return 0
+    return get_cart_totals_many([cart_id])[cart_id][0]
+
+
+def merge_anonymous_cart(request, user, previous_session_key=None):
+    """
+    Move the anonymous cart into ``user``'s cart after login.
+
+    Handles both the session payload cart and legacy database carts keyed
+    by the pre-login session key. Quantities for variants already in the
+    user's cart are added together.
+    """
+
+    session_cart = SessionCart(request.session)
+    lines = {int(variant_id): quantity for variant_id, quantity in session_cart._lines.items()}
+
+    legacy_cart = None
+    if previous_session_key:
+        legacy_cart = Cart.objects.filter(session_key=previous_session_key, user__isnull=True).first()
+        if legacy_cart:
+            for item in legacy_cart.items.all():
+                lines[item.product_variant_id] = lines.get(item.product_variant_id, 0) + item.quantity
+
+    # Variants may have been removed since they were added
+    active_ids = set(ProductVariant.objects.filter(
+        id__in=lines.keys(), is_active=True
+    ).values_list('id', flat=True))
+    lines = {variant_id: quantity for variant_id, quantity in lines.items() if variant_id in active_ids}
+
+    if lines:
+        # A fixed number of queries however big the cart: lock the lines
+        # the user already has, then one bulk update and one bulk insert
+        with transaction.atomic():
+            user_cart, created = Cart.objects.get_or_create(user=user)
+            existing = {
+                item.product_variant_id: item
+                for item in CartItem.objects.select_for_update().filter(
+                    cart=user_cart, product_variant_id__in=lines.keys()
+                )
+            }
+            for variant_id, item in existing.items():
+                item.quantity += lines[variant_id]
+            CartItem.objects.bulk_update(existing.values(), ['quantity'])
+            CartItem.objects.bulk_create([
+                CartItem(cart=user_cart, product_variant_id=variant_id, quantity=quantity)
+                for variant_id, quantity in lines.items()
+                if variant_id not in existing
+            ])
+        # Bulk writes skip the CartItem signals that maintain stored totals
+        transaction.on_commit(partial(invalidate_cart_totals, [user_cart.id]))
+
+    if legacy_cart:
+        legacy_cart.delete()
+    session_cart.clear()
@@ -0,0 +1,106 @@
+"""
+Mukurugenzi E-commerce Platform - Category Tree
+Materialized category hierarchy held in process memory
+
+The whole Category table is loaded in one query and each node gets its
+materialized path (root -> node ids) and full descendant id set. The built
+tree is shared through the cache and memoized per process by version, so
+descendant lookups, breadcrumbs and menus cost no queries until a category
+is saved or deleted.
+"""
+
+import threading
+
+from django.core.cache import cache
+
+from .models import Category
+
+
+CATEGORY_TREE_KEY = 'categories:tree'
+CATEGORY_TREE_VERSION_KEY = 'categories:tree_version'
+
+
+class CategoryTree:
+    """Category instances indexed by id and slug, with paths and descendants"""
+
+    def __init__(self, categories):
+        self.nodes = {category.id: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self.roots = []
+
+        for category in categories:
+            category.children = []
+        for category in categories:
+            parent = self.nodes.get(category.parent_id)
+            if parent is None:
+                self.roots.append(category)
+            else:
+                parent.children.append(category)
+
+        self.paths = {}
+        self.descendants = {}
+        stack = [(root, ()) for root in reversed(self.roots)]
+        order = []
+        while stack:
+            node, parent_path = stack.pop()
+            self.paths[node.id] = parent_path + (node.id,)
+            order.append(node)
+            stack.extend((child, self.paths[node.id]) for child in reversed(node.children))
+
+        # Children are visited after parents, so walk back up to fold subtrees
+        for node in reversed(order):
+            ids = {node.id}
+            for child in node.children:
+                ids |= self.descendants[child.id]
+            self.descendants[node.id] = frozenset(ids)
+
+    def get_active(self, slug):
+        category = self.by_slug.get(slug)
+        if category is not None and category.is_active:
+            return category
+        return None
+
+    def descendant_ids(self, category_id):
+        """The category and everything below it, at any depth"""
+        return self.descendants.get(category_id, frozenset())
+
+    def breadcrumbs(self, category_id):
+        return [self.nodes[node_id] for node_id in self.paths.get(category_id, ())]
+
+    def menu(self, limit=None):
+        """Active top-level categories, in the table's default order"""
+        roots = [category for category in self.roots if category.is_active]
+        return roots[:limit] if limit else roots
+
+
+_local = threading.local()
+
+
+def _tree_version():
+    return cache.get_or_set(CATEGORY_TREE_VERSION_KEY, 1, None)
+
+
+def get_category_tree():
+    """Return the current CategoryTree, loading it at most once per version"""
+
+    version = _tree_version()
+    tree = getattr(_local, 'tree', None)
+    if tree is not None and _local.version == version:
+        return tree
+
+    cached = cache.get(CATEGORY_TREE_KEY)
+    if cached is not None and cached[0] == version:
+        tree = cached[1]
+    else:
+        tree = CategoryTree(list(Category.objects.all()))
+        cache.set(CATEGORY_TREE_KEY, (version, tree), None)
+
+    _local.tree, _local.version = tree, version
+    return tree
+
+
+def invalidate_category_tree():
+    try:
+        cache.incr(CATEGORY_TREE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORY_TREE_VERSION_KEY, 1, None)
@@ -0,0 +1,172 @@
+"""
+Mukurugenzi E-commerce Platform - Currency Conversion
+Exchange rates from KES with Decimal-exact conversion
+
+Rates are kept as one table of Decimals per currency, stored in the cache
+and memoized per process. Only the scheduled refresh
+(``refresh_exchange_rates`` task / command) fetches them, from
+EXCHANGE_RATE_API_URL when one is configured, otherwise from the
+EXCHANGE_RATES setting; requests never wait on the provider and fall back
+to the settings table until a refresh has run. A failed fetch is retried
+with exponential backoff. Listing pages convert all of their prices in one
+call with a single rate lookup.
+"""
+
+import logging
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = 'KES'
+INTERNATIONAL_CURRENCY = 'USD'
+
+RATES_KEY = 'currency:rates'
+RATES_FAILURE_KEY = 'currency:rates:failure'
+
+RETRY_BASE_DELAY = 60  # seconds before the first retry of a failed fetch
+
+CENT = Decimal('0.01')
+
+
+class ExchangeRates:
+    """Rates as ``1 KES = rate <currency>``, plus when they were fetched"""
+
+    def __init__(self, rates, fetched_at, source):
+        self.rates = {code.upper(): Decimal(str(rate)) for code, rate in rates.items()}
+        self.rates[BASE_CURRENCY] = Decimal('1')
+        self.fetched_at = fetched_at
+        self.source = source
+
+    def rate(self, currency):
+        try:
+            return self.rates[currency.upper()]
+        except KeyError:
+            raise ValueError(f'No exchange rate for {currency}') from None
+
+    def convert(self, amount, currency):
+        """``amount`` KES in ``currency``, rounded half-up to cents"""
+        if amount is None:
+            return None
+        return (Decimal(amount) * self.rate(currency)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def convert_many(self, amounts, currency):
+        rate = self.rate(currency)
+        return [
+            None if amount is None else (amount * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+            for amount in amounts
+        ]
+
+
+def refresh_seconds():
+    return getattr(settings, 'EXCHANGE_RATE_REFRESH_SECONDS', 60 * 60)
+
+
+def retry_delay(failures):
+    """Seconds to wait after ``failures`` consecutive failed fetches"""
+    return min(RETRY_BASE_DELAY * 2 ** (failures - 1), refresh_seconds())
+
+
+def _settings_rates():
+    return ExchangeRates(getattr(settings, 'EXCHANGE_RATES', {}), time.time(), 'settings')
+
+
+def _fetch_rates(url):
+    response = requests.get(url, timeout=(3.05, 10))
+    response.raise_for_status()
+    # Parse as Decimal so no float rounding creeps into the rates
+    data = response.json(parse_float=Decimal)
+    return ExchangeRates(data['rates'], time.time(), url)
+
+
+def refresh_exchange_rates(force=False):
+    """
+    Fetch rates and publish them to every process.
+
+    Returns ``(rates, retry_at)``. When the provider fails the current table
+    is kept, the failure is recorded and ``retry_at`` is when to try again;
+    until then further calls skip the fetch (unless ``force``) and return
+    ``retry_at=None``, as a retry is already due.
+    """
+
+    url = getattr(settings, 'EXCHANGE_RATE_API_URL', '')
+    if not url:
+        rates = _settings_rates()
+        cache.set(RATES_KEY, rates, None)
+        return rates, None
+
+    current = cache.get(RATES_KEY) or _settings_rates()
+    failure = cache.get(RATES_FAILURE_KEY)
+    if failure is not None and not force and time.time() < failure['retry_at']:
+        return current, None
+
+    try:
+        rates = _fetch_rates(url)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        # Provider unreachable: keep serving its last rates
+        failures = failure['failures'] + 1 if failure is not None else 1
+        now = time.time()
+        retry_at = now + retry_delay(failures)
+        cache.set(RATES_FAILURE_KEY, {'failures': failures, 'failed_at': now, 'retry_at': retry_at}, None)
+        logger.warning('Exchange rate fetch failed (%d in a row): %s', failures, e)
+        return current, retry_at
+
+    cache.set(RATES_KEY, rates, None)
+    cache.delete(RATES_FAILURE_KEY)
+    return rates, None
+
+
+_local = threading.local()
+
+
+def get_exchange_rates():
+    """
+    Current rates, read from the cache at most once a minute per thread.
+
+    Never fetches: until the refresh task has published rates, the
+    EXCHANGE_RATES setting is served.
+    """
+
+    rates = getattr(_local, 'rates', None)
+    if rates is not None and time.monotonic() < _local.checked_until:
+        return rates
+
+    rates = cache.get(RATES_KEY)
+    if rates is None:
+        rates = _settings_rates()
+
+    _local.rates, _local.checked_until = rates, time.monotonic() + 60
+    return rates
+
+
+def convert(amount, currency):
+    return get_exchange_rates().convert(amount, currency)
+
+
+def display_currency(user):
+    """Currency a shopper sees prices in"""
+    if getattr(user, 'is_authenticated', False) and user.is_international:
+        return INTERNATIONAL_CURRENCY
+    return BASE_CURRENCY
+
+
+def attach_display_prices(products, currency):
+    """
+    Set ``display_price`` and ``display_compare_at_price`` on every product
+    in ``currency`` using one rate lookup for the whole page.
+    """
+
+    products = list(products)
+    rates = get_exchange_rates()
+    prices = rates.convert_many([product.base_price for product in products], currency)
+    compare_prices = rates.convert_many([product.compare_at_price for product in products], currency)
+    for product, price, compare_price in zip(products, prices, compare_prices):
+        product.display_price = price
+        product.display_compare_at_price = compare_price
+    return products
@@ -0,0 +1,93 @@
+"""
+Mukurugenzi E-commerce Platform - Delivery Lookup Table
+Versioned in-process table of counties, delivery stations and shipping zones
+
+The active delivery catalog is small and read on every checkout, so it is
+loaded in one pass and memoized per process. Saves and deletes in
+CountyAdmin, DeliveryStationAdmin and InternationalShippingZoneAdmin bump the
+shared version (see signals.py), and each process reloads on its next read.
+"""
+
+import threading
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import County, DeliveryStation, InternationalShippingZone
+
+
+DELIVERY_TABLE_KEY = 'delivery:table'
+DELIVERY_VERSION_KEY = 'delivery:version'
+
+
+class DeliveryTable:
+    """Active counties (with their active stations) and shipping zones"""
+
+    def __init__(self, counties, zones):
+        self.counties = counties
+        self.zones = zones
+        self.stations = {
+            station.id: station
+            for county in counties
+            for station in county.delivery_stations.all()
+        }
+        self.zones_by_id = {zone.id: zone for zone in zones}
+
+    def station_fee(self, station_id):
+        station = self.get_station(station_id)
+        return station.delivery_fee if station else None
+
+    def zone_fee(self, zone_id):
+        zone = self.get_zone(zone_id)
+        return zone.shipping_cost if zone else None
+
+    def get_station(self, station_id):
+        try:
+            return self.stations.get(int(station_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_zone(self, zone_id):
+        try:
+            return self.zones_by_id.get(int(zone_id))
+        except (TypeError, ValueError):
+            return None
+
+
+def _load_table():
+    counties = list(
+        County.objects.filter(is_active=True).prefetch_related(
+            Prefetch('delivery_stations', queryset=DeliveryStation.objects.filter(is_active=True))
+        )
+    )
+    zones = list(InternationalShippingZone.objects.filter(is_active=True))
+    return DeliveryTable(counties, zones)
+
+
+_local = threading.local()
+
+
+def get_delivery_table():
+    """The current DeliveryTable, loaded at most once per version per thread"""
+
+    version = cache.get_or_set(DELIVERY_VERSION_KEY, 1, None)
+    table = getattr(_local, 'table', None)
+    if table is not None and _local.version == version:
+        return table
+
+    cached = cache.get(DELIVERY_TABLE_KEY)
+    if cached is not None and cached[0] == version:
+        table = cached[1]
+    else:
+        table = _load_table()
+        cache.set(DELIVERY_TABLE_KEY, (version, table), None)
+
+    _local.table, _local.version = table, version
+    return table
+
+
+def invalidate_delivery_table():
+    try:
+        cache.incr(DELIVERY_VERSION_KEY)
+    except ValueError:
+        cache.set(DELIVERY_VERSION_KEY, 1, None)
@@ -0,0 +1,124 @@
+"""
+Mukurugenzi E-commerce Platform - Email Outbox
+Transactional email queued with the request and sent by a background worker
+
+``queue_email`` adds a message to the outbox when the current transaction
+commits (immediately outside one), so a rolled-back request never sends
+mail and a slow SMTP server never holds up a request. ``flush_outbox`` sends
+whatever is queued over one SMTP connection. A message that fails is retried
+with exponential backoff, up to MAX_ATTEMPTS times.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+
+from .queues import CacheQueue, QueueBusy
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 30  # seconds before the first retry, doubled each time
+
+OUTBOX_FLUSH_SCHEDULED_KEY = 'email:outbox:scheduled'
+OUTBOX_BATCH_DELAY = 1  # seconds of queued emails gathered into one flush
+
+outbox = CacheQueue('email:outbox')
+
+
+def queue_email(subject, body, to, from_email=None, html_body=None):
+    """Send an email after the current transaction commits"""
+
+    message = {
+        'subject': subject,
+        'body': body,
+        'html_body': html_body,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'to': list(to),
+        'attempts': 0,
+        'not_before': 0,
+    }
+    transaction.on_commit(lambda: _enqueue(message))
+
+
+def _enqueue(message):
+    from .tasks import schedule_outbox_flush
+
+    outbox.push(message)
+    try:
+        schedule_outbox_flush()
+    except Exception:
+        logger.exception('Could not schedule the email outbox flush')  # the next email retries
+
+
+def _build(message):
+    email = EmailMultiAlternatives(
+        message['subject'], message['body'], message['from_email'], message['to']
+    )
+    if message['html_body']:
+        email.attach_alternative(message['html_body'], 'text/html')
+    return email
+
+
+def _failed(message, now, error):
+    message['attempts'] += 1
+    if message['attempts'] >= MAX_ATTEMPTS:
+        logger.error('Dropping email %r to %s after %d attempts: %s',
+                     message['subject'], message['to'], message['attempts'], error)
+        return None
+    message['not_before'] = now + RETRY_BACKOFF * 2 ** (message['attempts'] - 1)
+    return message
+
+
+def flush_outbox(batch_size=100, connection=None):
+    """
+    Send queued emails over a single connection.
+
+    Returns (sent, retry_at): the number sent, and when the earliest
+    deferred message is next due (None if nothing is waiting). If another
+    flush is running, nothing is sent and retry_at is shortly after, so
+    messages queued behind that flush are not left waiting.
+    """
+
+    connection = connection or get_connection()
+    opened = False
+    sent = 0
+    deferred = []
+
+    try:
+        for batch in outbox.consume(batch_size):
+            now = time.time()
+            due = []
+            for message in batch:
+                (due if message['not_before'] <= now else deferred).append(message)
+
+            if due and not opened:
+                try:
+                    connection.open()
+                    opened = True
+                except Exception as e:
+                    deferred.extend(m for m in (_failed(m, now, e) for m in due) if m)
+                    continue
+
+            for message in due:
+                try:
+                    sent += connection.send_messages([_build(message)])
+                except Exception as e:
+                    retry = _failed(message, now, e)
+                    if retry:
+                        deferred.append(retry)
+    except QueueBusy:
+        return 0, time.time() + OUTBOX_BATCH_DELAY
+    finally:
+        if opened:
+            connection.close()
+        # Re-queue deferred messages even if the drain stopped part-way
+        for message in deferred:
+            outbox.push(message)
+
+    retry_at = min((message['not_before'] for message in deferred), default=None)
+    return sent, retry_at
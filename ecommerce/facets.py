@@ -0,0 +1,95 @@
+"""
+Mukurugenzi E-commerce Platform - Product Facets
+Category, brand, product type and price-bucket counts for the listing sidebar
+
+All four facets come from one GROUP BY over the filtered product queryset and
+are cached per normalized filter set. Any product change bumps the facet
+version, which retires every cached entry at once.
+"""
+
+import hashlib
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+
+FACET_CACHE_TIMEOUT = 60 * 15
+FACET_VERSION_KEY = 'facets:version'
+
+# (label, lower bound inclusive, upper bound exclusive) in KES
+PRICE_BUCKETS = [
+    ('Under 1,000', None, 1000),
+    ('1,000 - 2,500', 1000, 2500),
+    ('2,500 - 5,000', 2500, 5000),
+    ('5,000 - 10,000', 5000, 10000),
+    ('10,000 and above', 10000, None),
+]
+
+FILTER_PARAMS = ('q', 'category', 'brand', 'min_price', 'max_price', 'type')
+
+
+def _price_bucket_expression():
+    whens = []
+    for position, (label, low, high) in enumerate(PRICE_BUCKETS):
+        condition = Q()
+        if low is not None:
+            condition &= Q(base_price__gte=low)
+        if high is not None:
+            condition &= Q(base_price__lt=high)
+        whens.append(When(condition, then=Value(position)))
+    return Case(*whens, output_field=IntegerField())
+
+
+def facet_cache_key(params):
+    """Stable cache key for the filter-relevant part of a query string"""
+    normalized = '&'.join(
+        f'{name}={params.get(name, "").strip().lower()}' for name in FILTER_PARAMS
+    )
+    digest = hashlib.md5(normalized.encode()).hexdigest()
+    return f'facets:{cache.get_or_set(FACET_VERSION_KEY, 1, None)}:{digest}'
+
+
+def invalidate_facets():
+    try:
+        cache.incr(FACET_VERSION_KEY)
+    except ValueError:
+        cache.set(FACET_VERSION_KEY, 1, None)
+
+
+def compute_facets(queryset):
+    """Per-category, per-brand, per-type and per-price-bucket counts in one query"""
+
+    rows = queryset.prefetch_related(None).order_by().annotate(
+        price_bucket=_price_bucket_expression()
+    ).values(
+        'category_id', 'brand_id', 'product_type', 'price_bucket'
+    ).annotate(n=Count('id'))
+
+    categories, brands, types, prices = Counter(), Counter(), Counter(), Counter()
+    for row in rows:
+        categories[row['category_id']] += row['n']
+        if row['brand_id'] is not None:
+            brands[row['brand_id']] += row['n']
+        types[row['product_type']] += row['n']
+        prices[row['price_bucket']] += row['n']
+
+    return {
+        'categories': dict(categories),
+        'brands': dict(brands),
+        'product_types': dict(types),
+        'price_buckets': [
+            {'label': label, 'min': low, 'max': high, 'count': prices.get(position, 0)}
+            for position, (label, low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def get_facets(queryset, params):
+    """Facet counts for ``queryset``, cached under the normalized ``params``"""
+    key = facet_cache_key(params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,117 @@
+"""
+Mukurugenzi E-commerce Platform - Idempotency Keys
+Replay the first response for retried order and payment POSTs
+
+Clients send a key in the ``Idempotency-Key`` header or an
+``idempotency_key`` form field (see the ``idempotency_key`` template tag).
+The first request with a key runs the view and stores its response; repeats
+within the TTL get that response back without touching the database or the
+payment gateways. A duplicate that arrives while the first is still running
+waits for it instead of executing a second time.
+
+Only successful (2xx/3xx) responses are stored. Views wrap the response for
+a rejected request (empty cart, bad phone number) in ``retryable`` so that
+a corrected resubmission with the same key runs instead of replaying the
+error.
+"""
+
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+
+RESULT_TTL = 60 * 60 * 24
+IN_FLIGHT_TTL = 60
+WAIT_TIMEOUT = 30
+WAIT_INTERVAL = 0.1
+
+MAX_KEY_LENGTH = 128
+
+
+def _request_key(request):
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+    if key and len(key) <= MAX_KEY_LENGTH:
+        return key
+    return None
+
+
+def _serialize(response):
+    return {
+        'status': response.status_code,
+        'content': response.content,
+        'content_type': response.get('Content-Type'),
+        'location': response.get('Location'),
+    }
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    if stored['location']:
+        response['Location'] = stored['location']
+    response['Idempotent-Replay'] = 'true'
+    return response
+
+
+def retryable(response):
+    """Mark a response rejecting the request so it is not stored under the key"""
+    response.idempotent_store = False
+    return response
+
+
+def _storable(response):
+    return (
+        200 <= response.status_code < 400
+        and getattr(response, 'idempotent_store', True)
+        and not getattr(response, 'streaming', False)
+    )
+
+
+def idempotent(scope):
+    """View decorator making POSTs with an idempotency key run at most once"""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = _request_key(request)
+            if key is None:
+                return view_func(request, *args, **kwargs)
+
+            owner = request.user.pk if request.user.is_authenticated else request.session.session_key
+            result_key = f'idem:{scope}:{owner}:{request.path}:{key}'
+            lock_key = f'{result_key}:lock'
+
+            stored = cache.get(result_key)
+            if stored is not None:
+                return _replay(stored)
+
+            if not cache.add(lock_key, 1, IN_FLIGHT_TTL):
+                # Same request already in flight: wait for its result
+                deadline = time.monotonic() + WAIT_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(WAIT_INTERVAL)
+                    stored = cache.get(result_key)
+                    if stored is not None:
+                        return _replay(stored)
+                    if cache.get(lock_key) is None:
+                        break
+                stored = cache.get(result_key)
+                if stored is not None:
+                    return _replay(stored)
+                return HttpResponse('A request with this idempotency key is still being processed.', status=409)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+                if _storable(response):
+                    cache.set(result_key, _serialize(response), RESULT_TTL)
+                return response
+            finally:
+                cache.delete(lock_key)
+
+        return wrapper
+
+    return decorator
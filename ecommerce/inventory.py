@@ -0,0 +1,207 @@
+"""
+Mukurugenzi E-commerce Platform - Inventory Reservations
+Time-limited stock holds placed at checkout and converted into sales by place_order
+
+Holds are kept per variant as {holder: [quantity, expires_at]} in the cache,
+guarded by a short per-variant lock. Expired entries are ignored on read, so
+available-to-sell (stock minus active holds) is always correct. Variants
+that gain holds are appended to a registry queue, without any shared lock,
+and ``release_expired_holds`` (run by celery beat) compacts them in batches.
+
+Holds only mean something when every process sees the same cache, so with
+a per-process LocMem cache they are switched off: nothing is held and
+available-to-sell is plain stock.
+"""
+
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .queues import CacheQueue, QueueBusy
+
+
+logger = logging.getLogger(__name__)
+
+HOLD_KEY = 'hold:variant:{}'
+HOLD_LOCK_KEY = 'lock:{}'
+
+# Variants that may hold reservations. A variant is pushed when its hold
+# entry is created, and pushed again by compaction while holds remain.
+hold_registry = CacheQueue('hold:variants')
+
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.01
+
+
+def hold_seconds():
+    return getattr(settings, 'INVENTORY_HOLD_SECONDS', 15 * 60)
+
+
+def holds_enabled():
+    return not settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+
+
+class InsufficientStockError(Exception):
+    """Raised when a cart line asks for more units than are available"""
+
+    def __init__(self, variant, requested, available=None):
+        self.variant = variant
+        self.requested = requested
+        self.available = variant.stock_quantity if available is None else available
+        super().__init__(
+            f'{variant.product.name} has only {max(self.available, 0)} items in stock'
+        )
+
+
+@contextmanager
+def _locked(key):
+    """Cross-process mutex built on the cache's atomic add"""
+    lock_key = HOLD_LOCK_KEY.format(key)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Could not acquire {lock_key}')
+        time.sleep(LOCK_WAIT)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def _active(entries, now):
+    return {holder: entry for holder, entry in entries.items() if entry[1] > now}
+
+
+# ============================================================================
+# READS
+# ============================================================================
+
+def held_quantities(variant_ids, exclude_holder=None):
+    """Map variant id -> units held by active reservations"""
+
+    if not holds_enabled():
+        return {}
+    now = time.time()
+    keys = {HOLD_KEY.format(variant_id): variant_id for variant_id in variant_ids}
+    held = {}
+    for key, entries in cache.get_many(keys).items():
+        total = sum(
+            quantity for holder, (quantity, expires_at) in entries.items()
+            if expires_at > now and holder != exclude_holder
+        )
+        if total:
+            held[keys[key]] = total
+    return held
+
+
+def available_to_sell(variants, exclude_holder=None):
+    """Map variant id -> stock minus other shoppers' active holds"""
+    variants = list(variants)
+    held = held_quantities([variant.id for variant in variants], exclude_holder)
+    return {variant.id: variant.stock_quantity - held.get(variant.id, 0) for variant in variants}
+
+
+# ============================================================================
+# HOLDS
+# ============================================================================
+
+def reserve(holder, quantities, variants):
+    """
+    Hold ``quantities`` ({variant_id: qty}) for ``holder``, replacing the
+    holder's earlier holds on those variants. Raises InsufficientStockError,
+    leaving previous holds untouched, if any line cannot be held.
+    """
+
+    if not holds_enabled():
+        return
+    now = time.time()
+    expires_at = now + hold_seconds()
+    timeout = hold_seconds() * 2
+
+    # Lock in id order so concurrent checkouts cannot deadlock
+    variant_ids = sorted(quantities)
+    with ExitStack() as stack:
+        for variant_id in variant_ids:
+            stack.enter_context(_locked(HOLD_KEY.format(variant_id)))
+
+        keys = [HOLD_KEY.format(variant_id) for variant_id in variant_ids]
+        current = cache.get_many(keys)
+        updated = {}
+        for variant_id, key in zip(variant_ids, keys):
+            entries = _active(current.get(key, {}), now)
+            others = sum(quantity for h, (quantity, _) in entries.items() if h != holder)
+            variant = variants[variant_id]
+            if variant.stock_quantity - others < quantities[variant_id]:
+                raise InsufficientStockError(
+                    variant, quantities[variant_id], variant.stock_quantity - others
+                )
+            entries[holder] = [quantities[variant_id], expires_at]
+            updated[key] = entries
+
+        cache.set_many(updated, timeout)
+
+        # Still under the variant locks, so compaction sees a consistent state
+        for variant_id, key in zip(variant_ids, keys):
+            if key not in current:
+                hold_registry.push(variant_id)
+
+
+def reserve_cart(cart_items, holder):
+    """Hold every line of a loaded database cart (variants and products selected); see ``reserve``"""
+    quantities, variants = {}, {}
+    for item in cart_items:
+        variants[item.product_variant_id] = item.product_variant
+        quantities[item.product_variant_id] = quantities.get(item.product_variant_id, 0) + item.quantity
+    reserve(holder, quantities, variants)
+
+
+def release_holds(holder, variant_ids):
+    """Drop ``holder``'s holds on the given variants (after a sale or cancel)"""
+    if not holds_enabled():
+        return
+    for variant_id in variant_ids:
+        key = HOLD_KEY.format(variant_id)
+        try:
+            with _locked(key):
+                entries = cache.get(key)
+                if entries and entries.pop(holder, None) is not None:
+                    if entries:
+                        cache.set(key, entries, hold_seconds() * 2)
+                    else:
+                        cache.delete(key)
+        except TimeoutError:
+            # The hold lapses on its own when it expires
+            logger.warning('Could not release hold on variant %s for %s', variant_id, holder)
+
+
+def release_expired_holds(batch_size=500):
+    """Compact expired holds in batches; returns the number of holds released"""
+
+    released = 0
+    try:
+        for batch in hold_registry.consume(batch_size):
+            now = time.time()
+            keys = {HOLD_KEY.format(variant_id): variant_id for variant_id in set(batch)}
+            snapshot = cache.get_many(keys)
+            for key, variant_id in keys.items():
+                entries = snapshot.get(key)
+                if entries and len(_active(entries, now)) == len(entries):
+                    hold_registry.push(variant_id)  # nothing expired, skip the lock
+                    continue
+                with _locked(key):
+                    entries = cache.get(key) or {}
+                    active = _active(entries, now)
+                    released += len(entries) - len(active)
+                    if active:
+                        if len(active) != len(entries):
+                            cache.set(key, active, hold_seconds() * 2)
+                        hold_registry.push(variant_id)
+                    else:
+                        cache.delete(key)
+    except QueueBusy:
+        pass  # another worker is compacting
+
+    return released
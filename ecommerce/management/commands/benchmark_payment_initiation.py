@@ -0,0 +1,97 @@
+"""
+Benchmark web-worker throughput for STK push initiation, inline vs queued
+
+Starts the local M-Pesa stub with a configurable gateway latency and drives
+it from a fixed pool of "web worker" threads. In the inline mode each worker
+waits for the gateway the way the old view did. In the queued mode a worker
+only enqueues the call, and a separate task-worker pool drains the queue.
+An in-process queue stands in for the Celery broker, so the queued numbers
+leave out broker round-trip time (about a millisecond on a local Redis).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.mpesa import MpesaClient
+from ecommerce.mpesa_stub import start_stub_gateway
+
+
+class Command(BaseCommand):
+    help = 'Compare request throughput of inline vs background STK push initiation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--web-workers', type=int, default=8,
+                            help='Concurrent request handlers (gunicorn workers)')
+        parser.add_argument('--task-workers', type=int, default=16,
+                            help='Concurrent Celery worker slots in queued mode')
+        parser.add_argument('--latency', type=float, default=0.25,
+                            help='Simulated gateway latency in seconds')
+
+    def handle(self, *args, **options):
+        server = start_stub_gateway(latency=options['latency'])
+        client = MpesaClient(server.base_url, 'key', 'secret', '174379', 'passkey',
+                             'http://127.0.0.1/payment/mpesa/callback/',
+                             pool_size=options['task_workers'])
+        client.invalidate_token()
+        client.get_access_token()  # warm the token like a long-running worker
+
+        total = options['requests']
+        try:
+            inline = self._inline(client, total, options['web_workers'])
+            queued = self._queued(client, total, options['web_workers'], options['task_workers'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f"Gateway latency {options['latency'] * 1000:.0f} ms, "
+                          f"{options['web_workers']} web workers, {total} payments")
+        self.stdout.write(f'Inline: {total / inline:8.1f} req/s  ({inline:.2f}s wall)')
+        self.stdout.write(
+            f'Queued: {total / queued[0]:8.1f} req/s  ({queued[0]:.2f}s to answer, '
+            f'{queued[1]:.2f}s until all pushes sent)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Web throughput gain: {inline / queued[0]:.1f}x'))
+
+    def _push(self, client, n):
+        response = client.stk_push('254700000000', 100, f'BENCH{n}', 'Benchmark payment')
+        assert response.get('ResponseCode') == '0', response
+
+    def _inline(self, client, total, web_workers):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(web_workers) as pool:
+            list(pool.map(lambda n: self._push(client, n), range(total)))
+        return time.perf_counter() - started
+
+    def _queued(self, client, total, web_workers, task_workers):
+        broker = queue.Queue()
+        done = threading.Semaphore(0)
+
+        def task_worker():
+            while True:
+                n = broker.get()
+                if n is None:
+                    return
+                self._push(client, n)
+                done.release()
+
+        consumers = [threading.Thread(target=task_worker, daemon=True) for _ in range(task_workers)]
+        for consumer in consumers:
+            consumer.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(web_workers) as pool:
+            list(pool.map(broker.put, range(total)))
+        answered = time.perf_counter() - started
+
+        for _ in range(total):
+            done.acquire()
+        drained = time.perf_counter() - started
+
+        for _ in consumers:
+            broker.put(None)
+        return answered, drained
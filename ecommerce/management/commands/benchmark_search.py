@@ -0,0 +1,148 @@
+"""
+Benchmark ranked product search against the icontains query it replaced
+
+Both paths run against the configured database, doing what a listing page
+does: count the matches and fetch the first page. On PostgreSQL the ranked
+path is the tsvector query (run build_search_index first); elsewhere it is
+the in-process index plus the id-list query.
+
+By default the existing catalog is searched. ``--generate N`` first
+bulk-creates N synthetic products (and, on PostgreSQL, the search index if
+it is missing) inside a transaction that is rolled back afterwards.
+"""
+
+import random
+import string
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from ecommerce.models import Category, Product
+from ecommerce.search import (
+    SEARCH_INDEX_NAME, SEARCH_VECTOR_SQL, get_inverted_index, invalidate_search_index, search_products, tokenize
+)
+
+
+ADJECTIVES = ['classic', 'slim', 'vintage', 'leather', 'cotton', 'sport', 'waterproof',
+              'casual', 'formal', 'denim', 'wool', 'silk', 'canvas', 'suede', 'linen']
+NOUNS = ['shirt', 'dress', 'sneaker', 'boot', 'jacket', 'watch', 'bag', 'belt',
+         'hoodie', 'skirt', 'sandal', 'cap', 'scarf', 'trouser', 'blazer']
+COLOURS = ['red', 'blue', 'black', 'white', 'green', 'brown', 'grey', 'navy', 'beige', 'pink']
+FILLER = ['comfortable', 'durable', 'imported', 'handmade', 'breathable', 'lightweight',
+          'premium', 'stitched', 'kenyan', 'everyday', 'stylish', 'modern', 'soft']
+
+
+def generate_products(size, seed, category):
+    """Unsaved synthetic products; collection names make some queries selective"""
+    rng = random.Random(seed)
+    collections = [''.join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(5000)]
+    for n in range(1, size + 1):
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(COLOURS)} {rng.choice(NOUNS)} {rng.choice(collections)}'
+        yield Product(
+            name=name.title(),
+            slug=f'benchmark-{n}',
+            sku=f'BM-{n:07d}',
+            product_type='clothing',
+            category=category,
+            base_price=Decimal(rng.randint(500, 20000)),
+            description=' '.join(rng.choice(FILLER + ADJECTIVES + NOUNS) for _ in range(25)),
+        )
+
+
+def icontains_search(queryset, query):
+    """The search the products view ran before ranked search"""
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(sku__icontains=query)
+    ).order_by('-created_at')
+
+
+class Command(BaseCommand):
+    help = 'Compare ranked search with the old icontains query on the current catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', type=int, default=0, metavar='N',
+                            help='Benchmark on N generated products, rolled back afterwards')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not options['generate']:
+            self.benchmark(options)
+            return
+
+        try:
+            with transaction.atomic():
+                self.generate(options['generate'], options['seed'])
+                self.benchmark(options)
+                transaction.set_rollback(True)
+        finally:
+            invalidate_search_index()  # drop the generated rows from fallback indexes
+
+    def generate(self, size, seed):
+        started = time.perf_counter()
+        category = Category.objects.create(name='Search Benchmark', slug=f'search-benchmark-{seed}')
+        products = generate_products(size, seed, category)
+        while True:
+            batch = list(islice(products, 5000))
+            if not batch:
+                break
+            Product.objects.bulk_create(batch)  # skips the search-index signals
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Run the deferred foreign-key checks now; PostgreSQL will not
+                # index a table with pending trigger events
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                # Not CONCURRENTLY: the index is rolled back with the rows if it was missing
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX_NAME} '
+                    f'ON ecommerce_product USING GIN (({SEARCH_VECTOR_SQL}))'
+                )
+                cursor.execute('ANALYZE ecommerce_product')
+        else:
+            invalidate_search_index()
+        self.stdout.write(f'Generated:        {size} products in {time.perf_counter() - started:.2f}s')
+
+    def benchmark(self, options):
+        base = Product.objects.filter(is_active=True)
+        rng = random.Random(options['seed'])
+
+        names = list(base.order_by('?').values_list('name', flat=True)[:options['queries']])
+        if not names:
+            raise CommandError('No active products to search')
+        queries = []
+        for i in range(options['queries']):
+            tokens = tokenize(names[i % len(names)]) or ['a']
+            # Alternate one- and two-word queries taken from real product names
+            queries.append(' '.join(rng.sample(tokens, min(len(tokens), 1 + i % 2))))
+
+        if connection.vendor != 'postgresql':
+            started = time.perf_counter()
+            get_inverted_index()
+            self.stdout.write(f'Index build:      {time.perf_counter() - started:.2f}s')
+
+        per_page = options['per_page']
+
+        def run(search):
+            hits = 0
+            started = time.perf_counter()
+            for query in queries:
+                results = search(base, query)
+                hits += results.count()
+                list(results[:per_page])
+            return (time.perf_counter() - started) / len(queries), hits
+
+        old_seconds, old_hits = run(icontains_search)
+        new_seconds, new_hits = run(lambda queryset, query: search_products(queryset, query)[0])
+
+        self.stdout.write(f'Catalog:          {base.count()} active products, {connection.vendor}')
+        self.stdout.write(f'icontains query:  {old_seconds * 1000:.2f} ms/query ({old_hits} hits)')
+        self.stdout.write(f'Ranked search:    {new_seconds * 1000:.2f} ms/query ({new_hits} hits)')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {old_seconds / max(new_seconds, 1e-9):.1f}x'))
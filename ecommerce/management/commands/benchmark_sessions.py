@@ -0,0 +1,69 @@
+"""
+Benchmark session reads and writes per second under concurrent load
+
+Runs the same workload against the database engine and the cache-first
+``ecommerce.sessions`` engine. Each thread creates a session and then
+repeatedly loads it and updates a cart entry, the way add-to-cart does.
+Sessions created by the run are deleted afterwards.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+ENGINES = ['django.contrib.sessions.backends.db', 'ecommerce.sessions']
+
+
+class Command(BaseCommand):
+    help = 'Measure session reads/writes per second for the db and ecommerce.sessions engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--sessions', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Read-modify-write cycles per session')
+
+    def handle(self, *args, **options):
+        for engine in ENGINES:
+            reads, writes, seconds = self._run(import_module(engine).SessionStore, options)
+            self.stdout.write(
+                f'{engine:40} {reads / seconds:10.0f} reads/s {writes / seconds:10.0f} writes/s '
+                f'({seconds:.2f}s)'
+            )
+
+    def _run(self, store_class, options):
+        keys = []
+        lock = threading.Lock()
+
+        def shopper(n):
+            try:
+                session = store_class()
+                session['cart'] = {}
+                session.create()
+                with lock:
+                    keys.append(session.session_key)
+                for i in range(options['requests']):
+                    session = store_class(session.session_key)
+                    cart = dict(session.get('cart', {}))  # read
+                    cart[str(i % 5)] = cart.get(str(i % 5), 0) + 1
+                    session['cart'] = cart
+                    session.save()  # write
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            list(pool.map(shopper, range(options['sessions'])))
+        seconds = time.perf_counter() - started
+
+        for key in keys:
+            store_class(key).delete()
+        connection.close()
+
+        total = options['sessions'] * options['requests']
+        return total, total + options['sessions'], seconds
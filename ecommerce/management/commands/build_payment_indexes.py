@@ -0,0 +1,25 @@
+"""
+Create the Payment.transaction_id index used by M-Pesa callback processing
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ecommerce.models import Payment
+from ecommerce.payments import TRANSACTION_ID_INDEX_NAME
+
+
+class Command(BaseCommand):
+    help = 'Index payments by gateway transaction id (CheckoutRequestID)'
+
+    def handle(self, *args, **options):
+        table = connection.ops.quote_name(Payment._meta.db_table)
+        column = connection.ops.quote_name(Payment._meta.get_field('transaction_id').column)
+        concurrently = 'CONCURRENTLY ' if connection.vendor == 'postgresql' else ''
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX {concurrently}IF NOT EXISTS {TRANSACTION_ID_INDEX_NAME} '
+                f'ON {table} ({column})'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Index {TRANSACTION_ID_INDEX_NAME} is in place'))
@@ -0,0 +1,20 @@
+"""
+Rebuild the co-purchase neighbour file used for related products
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.recommendations import TOP_N_NEIGHBOURS, build_recommendations, recommendations_path
+
+
+class Command(BaseCommand):
+    help = 'Build item-item co-purchase recommendations from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=TOP_N_NEIGHBOURS)
+
+    def handle(self, *args, **options):
+        count = build_recommendations(top_n=options['top_n'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote neighbours for {count} products to {recommendations_path()}'
+        ))
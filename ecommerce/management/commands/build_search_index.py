@@ -0,0 +1,26 @@
+"""
+Create the product full-text GIN index (PostgreSQL) or warm the in-process index
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ecommerce.search import SEARCH_INDEX_NAME, SEARCH_VECTOR_SQL, get_inverted_index
+
+
+class Command(BaseCommand):
+    help = 'Build the product search index'
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {SEARCH_INDEX_NAME} '
+                    f'ON ecommerce_product USING GIN (({SEARCH_VECTOR_SQL}))'
+                )
+            self.stdout.write(self.style.SUCCESS(f'Index {SEARCH_INDEX_NAME} is in place'))
+        else:
+            index = get_inverted_index()
+            self.stdout.write(self.style.SUCCESS(
+                f'In-process index holds {len(index.documents)} products and {len(index.postings)} terms'
+            ))
@@ -0,0 +1,27 @@
+"""
+Create the case-insensitive User.email index used by email logins
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ecommerce.backends import EMAIL_INDEX_NAME
+from ecommerce.models import User
+
+
+class Command(BaseCommand):
+    help = 'Index users by email for case-insensitive login lookups'
+
+    def handle(self, *args, **options):
+        table = connection.ops.quote_name(User._meta.db_table)
+        column = connection.ops.quote_name(User._meta.get_field('email').column)
+
+        if connection.vendor == 'postgresql':
+            # Must match the expression email__iexact compiles to
+            statement = f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {EMAIL_INDEX_NAME} ON {table} (UPPER({column}::text))'
+        else:
+            statement = f'CREATE INDEX IF NOT EXISTS {EMAIL_INDEX_NAME} ON {table} ({column})'
+
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(f'Index {EMAIL_INDEX_NAME} is in place'))
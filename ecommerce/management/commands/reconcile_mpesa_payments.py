@@ -0,0 +1,47 @@
+"""
+Settle M-Pesa payments stuck in 'processing' by querying STK push status
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.mpesa import MpesaClient
+from ecommerce.mpesa_stub import start_stub_gateway
+from ecommerce.payments import reconcile_mpesa_payments
+
+
+class Command(BaseCommand):
+    help = 'Query Daraja for unsettled M-Pesa payments and apply the results in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=120,
+                            help='Only payments created at least this many seconds ago')
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Maximum concurrent status queries')
+        parser.add_argument('--stub', action='store_true',
+                            help='Query a local stub gateway (every payment reported paid)')
+
+    def handle(self, *args, **options):
+        server = client = None
+        if options['stub']:
+            server = start_stub_gateway()
+            client = MpesaClient(server.base_url, 'key', 'secret', '174379', 'passkey',
+                                 'http://127.0.0.1/payment/mpesa/callback/',
+                                 pool_size=options['workers'])
+            client.invalidate_token()
+
+        try:
+            checked, settled = reconcile_mpesa_payments(
+                older_than=timedelta(seconds=options['older_than']),
+                chunk_size=options['chunk_size'],
+                max_workers=options['workers'],
+                client=client,
+            )
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} payments, settled {settled}'))
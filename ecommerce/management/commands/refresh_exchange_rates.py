@@ -0,0 +1,19 @@
+"""
+Reload exchange rates from EXCHANGE_RATE_API_URL (or settings) into the shared cache
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.currency import refresh_exchange_rates
+
+
+class Command(BaseCommand):
+    help = 'Refresh the cached KES exchange-rate table'
+
+    def handle(self, *args, **options):
+        rates, retry_at = refresh_exchange_rates(force=True)
+        if retry_at is not None:
+            self.stdout.write(self.style.WARNING('Exchange rate provider unreachable, keeping the current rates'))
+        for code, rate in sorted(rates.rates.items()):
+            self.stdout.write(f'1 KES = {rate} {code}')
+        self.stdout.write(self.style.SUCCESS(f'Rates loaded from {rates.source}'))
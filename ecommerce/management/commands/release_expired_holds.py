@@ -0,0 +1,18 @@
+"""
+Release checkout stock holds whose TTL has passed
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Compact expired inventory reservation holds in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired holds'))
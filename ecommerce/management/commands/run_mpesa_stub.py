@@ -0,0 +1,41 @@
+"""
+Run a local stub of the M-Pesa Daraja API for development and testing
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.mpesa_stub import StubGateway
+
+
+class Command(BaseCommand):
+    help = 'Serve fake M-Pesa OAuth / STK push / STK query endpoints on localhost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds to sleep before answering each API call')
+        parser.add_argument('--token-ttl', type=int, default=3599)
+        parser.add_argument('--result-code', type=int, default=0,
+                            help='ResultCode returned by STK query (0 = paid)')
+        parser.add_argument('--still-processing', action='store_true',
+                            help='Answer STK queries as if the customer has not responded yet')
+        parser.add_argument('--verbose', action='store_true')
+
+    def handle(self, *args, **options):
+        server = StubGateway(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            token_ttl=options['token_ttl'],
+            result_code=None if options['still_processing'] else options['result_code'],
+            verbose=options['verbose'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'M-Pesa stub listening on {server.base_url} (set MPESA_BASE_URL to use it)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
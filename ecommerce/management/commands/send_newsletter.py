@@ -0,0 +1,46 @@
+"""
+Send a newsletter campaign to all active subscribers
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from ecommerce.newsletters import CampaignInterrupted, log_path, send_campaign
+
+
+class Command(BaseCommand):
+    help = 'Render a campaign once and send it to every active Newsletter subscriber'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help='Campaign name; reruns with the same slug retry failures and resume')
+        parser.add_argument('--subject', required=True)
+        parser.add_argument('--template', required=True, help='Plain-text body template')
+        parser.add_argument('--html-template', help='Optional HTML body template')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent SMTP connections')
+        parser.add_argument('--rate', type=float, default=10, help='Messages per second (0 = unlimited)')
+
+    def handle(self, *args, **options):
+        context = {'subject': options['subject']}
+        text_body = render_to_string(options['template'], context)
+        html_body = render_to_string(options['html_template'], context) if options['html_template'] else None
+
+        try:
+            summary = send_campaign(
+                options['slug'],
+                options['subject'],
+                text_body,
+                html_body,
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                rate=options['rate'],
+            )
+        except CampaignInterrupted as e:
+            raise CommandError(
+                f"SMTP server unreachable ({e}) after sending {e.summary['sent']}; "
+                f"rerun to resume (log: {log_path(options['slug'])})"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {summary['sent']}, refused {summary['refused']}, failed {summary['failed']} "
+            f"(log: {log_path(options['slug'])})"
+        ))
@@ -0,0 +1,18 @@
+"""
+Send everything in the email outbox now (the Celery task does this normally)
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.emails import flush_outbox, outbox
+
+
+class Command(BaseCommand):
+    help = 'Flush the transactional email outbox over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        sent, retry_at = flush_outbox(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {len(outbox)} still queued'))
@@ -0,0 +1,216 @@
+"""
+Mukurugenzi E-commerce Platform - M-Pesa Daraja Client
+Shared HTTP client for Safaricom STK Push with a cached OAuth token
+
+One client per process keeps a pooled keep-alive ``requests.Session`` with
+timeouts and bounded retries. The access token is cached until shortly
+before it expires, and only one worker refreshes it at a time; the others
+wait for the fresh token instead of stampeding the OAuth endpoint.
+"""
+
+import base64
+import re
+import threading
+import time
+from datetime import datetime
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+SANDBOX_BASE_URL = 'https://sandbox.safaricom.co.ke'
+PRODUCTION_BASE_URL = 'https://api.safaricom.co.ke'
+
+TOKEN_CACHE_KEY = 'mpesa:access_token'
+TOKEN_LOCK_KEY = 'mpesa:access_token:lock'
+TOKEN_EXPIRY_MARGIN = 60  # refresh this many seconds before expiry
+TOKEN_LOCK_TIMEOUT = 15
+
+PHONE_NUMBER_RE = re.compile(r'254[17]\d{8}')
+
+DEFAULT_TIMEOUT = (3.05, 15)  # (connect, read) seconds
+
+
+class MpesaError(Exception):
+    """Raised when the gateway cannot be reached or returns garbage"""
+
+
+def format_phone_number(phone_number):
+    """Normalize 07..., +2547... and 7... to the 2547... form Daraja expects"""
+    phone_number = (phone_number or '').strip().replace(' ', '')
+    if phone_number.startswith('+254'):
+        return phone_number[1:]
+    if phone_number.startswith('0'):
+        return '254' + phone_number[1:]
+    if not phone_number.startswith('254'):
+        return '254' + phone_number
+    return phone_number
+
+
+def is_valid_phone_number(phone_number):
+    """Whether a formatted number is a Kenyan mobile number STK push can reach"""
+    return bool(PHONE_NUMBER_RE.fullmatch(phone_number))
+
+
+class MpesaClient:
+
+    def __init__(self, base_url, consumer_key, consumer_secret, shortcode, passkey, callback_url,
+                 timeout=DEFAULT_TIMEOUT, pool_size=10, max_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.timeout = timeout
+
+        # Connection errors are retried for every method (nothing was sent);
+        # read/status retries only for GET so an STK push is never repeated
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    # OAuth
+    # ------------------------------------------------------------------------
+
+    def _fetch_token(self):
+        try:
+            response = self.session.get(
+                f'{self.base_url}/oauth/v1/generate',
+                params={'grant_type': 'client_credentials'},
+                auth=(self.consumer_key, self.consumer_secret),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data['access_token'], int(data.get('expires_in', 3599))
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise MpesaError(f'Could not obtain M-Pesa access token: {e}') from e
+
+    def get_access_token(self):
+        """Cached bearer token, refreshed by a single worker when it nears expiry"""
+
+        if self._token and time.time() < self._token_expires_at:
+            return self._token
+
+        with self._lock:
+            if self._token and time.time() < self._token_expires_at:
+                return self._token
+
+            deadline = time.monotonic() + TOKEN_LOCK_TIMEOUT
+            while True:
+                cached = cache.get(TOKEN_CACHE_KEY)
+                if cached:
+                    self._token, self._token_expires_at = cached
+                    return self._token
+
+                if cache.add(TOKEN_LOCK_KEY, 1, TOKEN_LOCK_TIMEOUT):
+                    try:
+                        token, expires_in = self._fetch_token()
+                        ttl = max(expires_in - TOKEN_EXPIRY_MARGIN, 1)
+                        self._token, self._token_expires_at = token, time.time() + ttl
+                        cache.set(TOKEN_CACHE_KEY, (token, self._token_expires_at), ttl)
+                        return token
+                    finally:
+                        cache.delete(TOKEN_LOCK_KEY)
+
+                # Another worker is refreshing; wait for it to publish
+                if time.monotonic() > deadline:
+                    raise MpesaError('Timed out waiting for M-Pesa token refresh')
+                time.sleep(0.05)
+
+    def invalidate_token(self):
+        self._token, self._token_expires_at = None, 0
+        cache.delete(TOKEN_CACHE_KEY)
+
+    # ------------------------------------------------------------------------
+    # API calls
+    # ------------------------------------------------------------------------
+
+    def _password(self, timestamp):
+        return base64.b64encode(f"{self.shortcode}{self.passkey}{timestamp}".encode()).decode()
+
+    def _post(self, path, payload):
+        for attempt in range(2):
+            headers = {'Authorization': f'Bearer {self.get_access_token()}'}
+            try:
+                response = self.session.post(
+                    f'{self.base_url}{path}', json=payload, headers=headers, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise MpesaError(f'M-Pesa request failed: {e}') from e
+            if response.status_code == 401 and attempt == 0:
+                # Token revoked early: refresh once and retry
+                self.invalidate_token()
+                continue
+            try:
+                return response.json()
+            except ValueError as e:
+                raise MpesaError(f'Invalid M-Pesa response ({response.status_code})') from e
+
+    def stk_push(self, phone_number, amount, account_reference, description):
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        return self._post('/mpesa/stkpush/v1/processrequest', {
+            "BusinessShortCode": self.shortcode,
+            "Password": self._password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": int(amount),
+            "PartyA": phone_number,
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone_number,
+            "CallBackURL": self.callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": description,
+        })
+
+    def stk_query(self, checkout_request_id):
+        """Ask Daraja for the outcome of an earlier STK push"""
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        return self._post('/mpesa/stkpushquery/v1/query', {
+            "BusinessShortCode": self.shortcode,
+            "Password": self._password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        })
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mpesa_client():
+    """Process-wide MpesaClient built from settings"""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                base_url = getattr(settings, 'MPESA_BASE_URL', '') or (
+                    SANDBOX_BASE_URL if settings.MPESA_ENVIRONMENT == 'sandbox' else PRODUCTION_BASE_URL
+                )
+                _client = MpesaClient(
+                    base_url=base_url,
+                    consumer_key=settings.MPESA_CONSUMER_KEY,
+                    consumer_secret=settings.MPESA_CONSUMER_SECRET,
+                    shortcode=settings.MPESA_SHORTCODE,
+                    passkey=settings.MPESA_PASSKEY,
+                    callback_url=settings.MPESA_CALLBACK_URL,
+                    timeout=getattr(settings, 'MPESA_TIMEOUT', DEFAULT_TIMEOUT),
+                )
+    return _client
@@ -0,0 +1,115 @@
+"""
+Mukurugenzi E-commerce Platform - Local M-Pesa Stub Gateway
+Minimal stand-in for the Daraja endpoints used by ecommerce.mpesa
+
+Serves OAuth, STK push and STK query with configurable latency so the
+client, the payment tasks and the reconciliation poller can be exercised
+(and benchmarked) without Safaricom credentials. Point ``MPESA_BASE_URL``
+at it, e.g. ``MPESA_BASE_URL=http://127.0.0.1:8765``.
+"""
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        return token in self.server.tokens
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/oauth/v1/generate':
+            return self._reply(404, {'errorMessage': 'Not found'})
+        self.server.count('oauth')
+        token = f'stub-token-{next(self.server.sequence)}'
+        self.server.tokens.add(token)
+        self._reply(200, {'access_token': token, 'expires_in': str(self.server.token_ttl)})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        path = urlparse(self.path).path
+
+        if not self._authorized():
+            return self._reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if path == '/mpesa/stkpush/v1/processrequest':
+            self.server.count('stk_push')
+            checkout_request_id = f'ws_CO_STUB_{next(self.server.sequence)}'
+            return self._reply(200, {
+                'MerchantRequestID': f'stub-{payload.get("AccountReference", "")}',
+                'CheckoutRequestID': checkout_request_id,
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing',
+            })
+
+        if path == '/mpesa/stkpushquery/v1/query':
+            self.server.count('stk_query')
+            if self.server.result_code is None:
+                return self._reply(500, {
+                    'requestId': payload.get('CheckoutRequestID'),
+                    'errorCode': '500.001.1001',
+                    'errorMessage': 'The transaction is being processed',
+                })
+            return self._reply(200, {
+                'ResponseCode': '0',
+                'ResponseDescription': 'The service request has been accepted successsfully',
+                'CheckoutRequestID': payload.get('CheckoutRequestID'),
+                'ResultCode': str(self.server.result_code),
+                'ResultDesc': 'The service request is processed successfully.'
+                              if self.server.result_code == 0 else 'Request cancelled by user',
+            })
+
+        self._reply(404, {'errorMessage': 'Not found'})
+
+
+class StubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, token_ttl=3599, result_code=0, verbose=False):
+        super().__init__(address, StubGatewayHandler)
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.result_code = result_code
+        self.verbose = verbose
+        self.tokens = set()
+        self.sequence = itertools.count(1)
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name):
+        with self._calls_lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+
+def start_stub_gateway(host='127.0.0.1', port=0, **options):
+    """Run a StubGateway on a background thread; call ``shutdown()`` when done"""
+    server = StubGateway((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
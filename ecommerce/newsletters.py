@@ -0,0 +1,238 @@
+"""
+Mukurugenzi E-commerce Platform - Newsletter Campaigns
+Streams active Newsletter subscribers to a pool of SMTP senders
+
+The campaign body is rendered once. Subscribers are read in id order with a
+server-side cursor, one chunk at a time, and each chunk is sent by a few
+threads that each keep one SMTP connection open, all sharing one rate limit.
+Per-recipient results are appended to the campaign's delivery log once per
+chunk, and addresses the server refuses are unsubscribed in bulk. The log
+also records how far the campaign got: a rerun first re-sends to the
+subscribers whose latest entry is a failure, then resumes after the last
+finished chunk. If the SMTP server cannot be reached the run stops without
+finishing the chunk, rather than logging every remaining subscriber as
+failed. Memory use depends on the chunk size and the number of failures,
+not the list size.
+"""
+
+import json
+import os
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+from .models import Newsletter
+
+
+SENT = 'sent'
+REFUSED = 'refused'
+FAILED = 'failed'
+
+# SMTP errors that mean the server, not the recipient, is the problem
+SERVER_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError)
+
+
+class CampaignInterrupted(Exception):
+    """The SMTP server became unreachable; rerun the campaign to carry on"""
+
+    def __init__(self, summary, error):
+        super().__init__(error)
+        self.summary = summary
+
+
+class RateLimiter:
+    """At most ``rate`` acquisitions per second across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _SenderPool:
+    """One SMTP connection per worker thread, opened on first use"""
+
+    def __init__(self, connection_factory):
+        self.connection_factory = connection_factory
+        self.local = threading.local()
+        self.connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_factory()
+            connection.open()
+            with self._lock:
+                self.connections.append(connection)
+        return connection
+
+    def reset(self):
+        """Drop this thread's connection after an error; the next send reconnects"""
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def log_path(slug):
+    log_dir = getattr(settings, 'NEWSLETTER_LOG_DIR', os.path.join(settings.BASE_DIR, 'data', 'newsletters'))
+    return os.path.join(log_dir, f'{slug}.jsonl')
+
+
+def _server_unreachable(error):
+    if isinstance(error, smtplib.SMTPException):
+        return isinstance(error, SERVER_ERRORS)
+    return isinstance(error, OSError)  # refused, timed out, DNS failure
+
+
+def _read_log(path):
+    """
+    Where a previous run got to: ``(checkpoint, failed, done)``.
+
+    ``checkpoint`` is the highest subscriber id of the last finished chunk,
+    ``failed`` the ids whose latest delivery failed and ``done`` the ids after
+    the checkpoint that already have an entry (an interrupted chunk; its
+    failures are retried along with the rest of ``failed``).
+    """
+
+    checkpoint, failed, done = 0, set(), set()
+    if os.path.exists(path):
+        with open(path) as log:
+            for line in log:
+                entry = json.loads(line)
+                if 'checkpoint' in entry:
+                    checkpoint = entry['checkpoint']
+                    done.clear()
+                else:
+                    if entry['status'] == FAILED:
+                        failed.add(entry['id'])
+                    else:
+                        failed.discard(entry['id'])
+                    done.add(entry['id'])
+    return checkpoint, failed, done
+
+
+def _write_results(log, results, stamp):
+    log.writelines(
+        json.dumps({'id': subscriber_id, 'email': email, 'status': status, 'error': error, 'at': stamp}) + '\n'
+        for subscriber_id, email, status, error in results
+    )
+
+
+def send_campaign(slug, subject, text_body, html_body=None, from_email=None,
+                  chunk_size=500, workers=4, rate=10, connection_factory=get_connection):
+    """
+    Send a rendered campaign to every active subscriber.
+
+    ``rate`` caps messages per second over all workers (0 for no limit).
+    Returns a {status: count} summary for this run. Raises
+    CampaignInterrupted, after logging what was delivered, if the SMTP
+    server cannot be reached.
+    """
+
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    path = log_path(slug)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    checkpoint, failed, done = _read_log(path)
+    active = Newsletter.objects.filter(is_active=True).order_by('id').values_list('id', 'email')
+    failed = sorted(failed)
+    retries = (
+        subscriber
+        for start in range(0, len(failed), chunk_size)
+        for subscriber in active.filter(id__in=failed[start:start + chunk_size])
+    )
+    subscribers = (
+        subscriber
+        for subscriber in active.filter(id__gt=checkpoint).iterator(chunk_size=chunk_size)
+        if subscriber[0] not in done
+    )
+
+    limiter = RateLimiter(rate)
+    senders = _SenderPool(connection_factory)
+    summary = {SENT: 0, REFUSED: 0, FAILED: 0}
+    unreachable = []
+
+    def deliver(subscriber):
+        if unreachable:
+            return None  # left for the rerun
+        subscriber_id, email = subscriber
+        message = EmailMultiAlternatives(subject, text_body, from_email, [email])
+        if html_body:
+            message.attach_alternative(html_body, 'text/html')
+        limiter.acquire()
+        try:
+            senders.connection().send_messages([message])
+            return subscriber_id, email, SENT, ''
+        except smtplib.SMTPRecipientsRefused as e:
+            return subscriber_id, email, REFUSED, str(e)
+        except Exception as e:
+            senders.reset()
+            if _server_unreachable(e):
+                unreachable.append(e)
+            return subscriber_id, email, FAILED, str(e)
+
+    def send(pool, log, chunk, checkpoint=None):
+        results = [result for result in pool.map(deliver, chunk) if result is not None]
+        now = timezone.now()
+
+        refused = [subscriber_id for subscriber_id, _, status, _ in results if status == REFUSED]
+        if refused:
+            Newsletter.objects.filter(id__in=refused).update(is_active=False, unsubscribed_at=now)
+
+        stamp = now.isoformat()
+        _write_results(log, results, stamp)
+        if checkpoint is not None and not unreachable:
+            log.write(json.dumps({'checkpoint': checkpoint, 'at': stamp}) + '\n')
+        log.flush()
+
+        for _, _, status, _ in results:
+            summary[status] += 1
+        if unreachable:
+            raise CampaignInterrupted(summary, unreachable[0])
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool, open(path, 'a') as log:
+            # Earlier failures first; they carry no checkpoint of their own
+            while True:
+                chunk = list(islice(retries, chunk_size))
+                if not chunk:
+                    break
+                send(pool, log, chunk)
+
+            while True:
+                chunk = list(islice(subscribers, chunk_size))
+                if not chunk:
+                    break
+                send(pool, log, chunk, checkpoint=chunk[-1][0])
+    finally:
+        senders.close()
+
+    return summary
@@ -0,0 +1,101 @@
+"""
+Mukurugenzi E-commerce Platform - Order Placement
+Turns a cart into an order in a single transaction without overselling
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+
+from .inventory import InsufficientStockError, held_quantities, release_holds
+from .models import CartItem, Order, OrderItem, OrderStatusHistory, ProductVariant
+
+
+def _variant_details(variant):
+    return (
+        f"Size: {variant.size.name if variant.size else 'N/A'}, "
+        f"Color: {variant.color.name if variant.color else 'N/A'}"
+    )
+
+
+def place_order_from_cart(cart, user, delivery_fee, created_by=None, **order_fields):
+    """
+    Create an order from ``cart`` and decrement stock atomically.
+
+    The cart's variants are locked (in id order, to avoid deadlocks between
+    concurrent checkouts) before stock is checked, so two buyers can never
+    both take the last unit. Stock held by other shoppers' checkouts is not
+    sellable; the buyer's own hold is released once the order commits.
+    Raises InsufficientStockError and rolls back everything if any line
+    cannot be fulfilled. Returns the Order, or None if the cart is empty.
+    """
+
+    with transaction.atomic():
+        cart_items = list(cart.items.all())
+        if not cart_items:
+            return None
+
+        # Lock only the variant rows: size and color are outer-joined, and
+        # PostgreSQL cannot lock the nullable side of an outer join
+        variants = {
+            variant.id: variant
+            for variant in ProductVariant.objects.select_for_update(of=('self',)).filter(
+                id__in=[item.product_variant_id for item in cart_items]
+            ).select_related('product', 'size', 'color').order_by('id')
+        }
+
+        quantities = {}
+        for item in cart_items:
+            quantities[item.product_variant_id] = quantities.get(item.product_variant_id, 0) + item.quantity
+
+        # The buyer's own checkout hold turns into the sale; other shoppers'
+        # active holds stay protected
+        held_by_others = held_quantities(quantities, exclude_holder=user.id)
+        for variant_id, quantity in quantities.items():
+            variant = variants[variant_id]
+            available = variant.stock_quantity - held_by_others.get(variant_id, 0)
+            if available < quantity:
+                raise InsufficientStockError(variant, quantity, available)
+            variant.stock_quantity -= quantity
+        ProductVariant.objects.bulk_update(variants.values(), ['stock_quantity'])
+
+        subtotal = sum(
+            (variants[item.product_variant_id].price * item.quantity for item in cart_items),
+            Decimal('0')
+        )
+
+        order = Order.objects.create(
+            user=user,
+            subtotal=subtotal,
+            delivery_fee=delivery_fee,
+            total_amount=subtotal + delivery_fee,
+            status='pending',
+            **order_fields
+        )
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_variant=variants[item.product_variant_id],
+                product_name=variants[item.product_variant_id].product.name,
+                variant_details=_variant_details(variants[item.product_variant_id]),
+                quantity=item.quantity,
+                unit_price=variants[item.product_variant_id].price,
+                total_price=variants[item.product_variant_id].price * item.quantity
+            )
+            for item in cart_items
+        ])
+
+        OrderStatusHistory.objects.create(
+            order=order,
+            status='pending',
+            notes='Order created',
+            created_by=created_by
+        )
+
+        # Clear cart
+        CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+
+        transaction.on_commit(lambda: release_holds(user.id, list(quantities)))
+
+    return order
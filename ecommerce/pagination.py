@@ -0,0 +1,144 @@
+"""
+Mukurugenzi E-commerce Platform - Keyset Pagination
+Cursor-based paging that seeks on (sort key, id) instead of OFFSET scanning
+
+Tokens are signed, so clients can only hand back cursors the server issued.
+Every page costs one indexed range query regardless of depth; the total count
+is only estimated, and only when a template actually asks for it.
+"""
+
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+CURSOR_SALT = 'ecommerce.pagination.cursor'
+
+# Exact counts are only run on non-PostgreSQL backends, and capped there
+COUNT_CAP = 10000
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+    return value
+
+
+def _ordering_for(sort_field):
+    """('-created_at') -> [('created_at', True), ('id', True)]"""
+    descending = sort_field.startswith('-')
+    field = sort_field.lstrip('-')
+    return [(field, descending), ('id', descending)]
+
+
+def _seek_filter(ordering, values, forward):
+    """Rows strictly after (forward) or before the given key, in ``ordering``"""
+    field, descending = ordering[0]
+    value, pk = values
+    after_desc = descending if forward else not descending
+    op = 'lt' if after_desc else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+
+
+def _order_by(ordering, reverse=False):
+    return [
+        f"{'-' if descending != reverse else ''}{field}"
+        for field, descending in ordering
+    ]
+
+
+def estimate_count(queryset):
+    """Planner row estimate on PostgreSQL, capped exact count elsewhere"""
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.order_by()[:COUNT_CAP].count()
+
+
+class CursorPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, queryset, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self._queryset = queryset
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @cached_property
+    def estimated_count(self):
+        return estimate_count(self._queryset)
+
+
+def cursor_paginate(queryset, sort_field, cursor=None, per_page=12):
+    """
+    Return a CursorPage of ``queryset`` ordered by ``sort_field`` plus id.
+
+    ``cursor`` is a token from a previous page's next_cursor/previous_cursor;
+    an invalid or tampered token falls back to the first page.
+    """
+
+    ordering = _ordering_for(sort_field)
+    forward = True
+    position = None
+
+    if cursor:
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            if payload['s'] == sort_field:
+                position = [_decode_value(value) for value in payload['k']]
+                forward = payload['d'] == 'n'
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            position = None
+
+    page_qs = queryset
+    if position is not None:
+        page_qs = page_qs.filter(_seek_filter(ordering, position, forward))
+    page_qs = page_qs.order_by(*_order_by(ordering, reverse=not forward))
+
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def token(obj, direction):
+        keys = [_encode_value(getattr(obj, field)) for field, _ in ordering]
+        return signing.dumps({'s': sort_field, 'k': keys, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    if forward:
+        has_next, has_previous = has_more, position is not None
+    else:
+        has_next, has_previous = True, has_more
+
+    return CursorPage(
+        queryset,
+        rows,
+        has_next=has_next,
+        has_previous=has_previous,
+        next_cursor=token(rows[-1], 'n') if rows and has_next else None,
+        previous_cursor=token(rows[0], 'p') if rows and has_previous else None,
+    )
@@ -0,0 +1,259 @@
+"""
+Mukurugenzi E-commerce Platform - Payment Processing
+Background payment attempts and batched M-Pesa result handling
+
+The payment views enqueue the gateway round trip and return right away. The
+task records its progress here and the browser polls ``payment_status``
+until the attempt is finished: either a redirect (PayPal approval or
+order confirmation) or a failure message.
+
+M-Pesa callbacks are saved on their Payment row with one indexed UPDATE,
+queued and then acknowledged. ``drain_mpesa_callbacks`` applies them in
+batches with one query per table, and skips payments that are already
+settled, so Safaricom's retries are harmless. ``reconcile_mpesa_payments``
+settles payments whose queued callback was lost, from the saved result, and
+payments whose callback never arrived, by asking Daraja directly.
+"""
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderStatusHistory, Payment
+from .mpesa import MpesaError, get_mpesa_client
+from .queues import CacheQueue
+
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_KEY = 'payment:attempt:{}'
+ATTEMPT_TIMEOUT = 60 * 60
+
+PENDING = 'pending'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def start_attempt(order, user, method):
+    """Register a new attempt for ``order`` and return its id"""
+    attempt_id = uuid.uuid4().hex
+    cache.set(ATTEMPT_KEY.format(attempt_id), {
+        'order_id': order.id,
+        'user_id': user.id,
+        'method': method,
+        'status': PENDING,
+        'message': '',
+        'redirect_url': None,
+    }, ATTEMPT_TIMEOUT)
+    return attempt_id
+
+
+def get_attempt(attempt_id, user=None):
+    """The attempt's state, or None if unknown, expired or not ``user``'s"""
+    attempt = cache.get(ATTEMPT_KEY.format(attempt_id))
+    if attempt is None or (user is not None and attempt['user_id'] != user.id):
+        return None
+    return attempt
+
+
+def finish_attempt(attempt_id, status, message='', redirect_url=None):
+    key = ATTEMPT_KEY.format(attempt_id)
+    attempt = cache.get(key)
+    if attempt is None:
+        # Expired, or written to a cache this process cannot see
+        logger.warning('Payment attempt %s is unknown, dropping its %s result', attempt_id, status)
+        return
+    attempt.update(status=status, message=message, redirect_url=redirect_url)
+    cache.set(key, attempt, ATTEMPT_TIMEOUT)
+
+
+# ============================================================================
+# M-PESA RESULTS
+# ============================================================================
+
+CALLBACK_QUEUED_KEY = 'mpesa:callback:{}'
+CALLBACK_DRAIN_SCHEDULED_KEY = 'mpesa:callback:scheduled'
+CALLBACK_BATCH_DELAY = 2  # seconds of callbacks gathered into one drain
+CALLBACK_TIMEOUT = 7 * 24 * 60 * 60
+
+UNSETTLED_STATUSES = ('pending', 'processing')
+
+callback_queue = CacheQueue('mpesa:callback:queue', timeout=CALLBACK_TIMEOUT)
+
+# Callback and reconciliation lookups go by Payment.transaction_id
+TRANSACTION_ID_INDEX_NAME = 'ecommerce_payment_transaction_id_idx'
+
+
+class PaymentNotFound(Exception):
+    """A callback named a CheckoutRequestID with no Payment"""
+
+
+def _receipt(callback_data):
+    items = callback_data.get('CallbackMetadata', {}).get('Item', [])
+    return {item.get('Name'): item.get('Value') for item in items}.get('MpesaReceiptNumber')
+
+
+def _is_result(response):
+    """True for a stored stkCallback body (the STK push response has no ResultCode)"""
+    return isinstance(response, dict) and response.get('ResultCode') not in (None, '')
+
+
+def queue_mpesa_callback(callback_data):
+    """
+    Save an stkCallback body on its Payment and queue it for batch settlement.
+
+    The body is in the database before Safaricom gets an acknowledgement,
+    so a lost queue entry only delays settlement until the next
+    reconciliation. Returns False for a repeat delivery, which needs nothing
+    more than an acknowledgement. Raises PaymentNotFound for an unknown
+    CheckoutRequestID, without recording it, so a redelivery is retried.
+    """
+
+    checkout_request_id = callback_data['CheckoutRequestID']
+    saved = Payment.objects.filter(
+        transaction_id=checkout_request_id, status__in=UNSETTLED_STATUSES
+    ).update(gateway_response=callback_data, updated_at=timezone.now())
+
+    if not saved:
+        if Payment.objects.filter(transaction_id=checkout_request_id).exists():
+            return False  # already settled
+        logger.warning('M-Pesa callback for unknown CheckoutRequestID %s', checkout_request_id)
+        raise PaymentNotFound(checkout_request_id)
+
+    queued_key = CALLBACK_QUEUED_KEY.format(checkout_request_id)
+    if not cache.add(queued_key, 1, CALLBACK_TIMEOUT):
+        return False
+    try:
+        callback_queue.push(checkout_request_id)
+    except Exception:
+        cache.delete(queued_key)
+        raise
+    return True
+
+
+def apply_mpesa_results(results):
+    """
+    Settle M-Pesa payments in bulk.
+
+    ``results`` maps CheckoutRequestID -> stkCallback-shaped dict (ResultCode,
+    ResultDesc, optional CallbackMetadata). Payments that are no longer
+    pending or processing are left alone. Returns the number settled.
+    """
+
+    if not results:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            # of=('self',): the nullable order is outer-joined, and PostgreSQL
+            # cannot lock the nullable side of an outer join
+            Payment.objects.select_for_update(of=('self',)).select_related('order').filter(
+                transaction_id__in=list(results), status__in=UNSETTLED_STATUSES
+            )
+        )
+
+        orders, history = [], []
+        for payment in payments:
+            callback_data = results[payment.transaction_id]
+            payment.gateway_response = callback_data
+            payment.updated_at = now
+            if str(callback_data.get('ResultCode')) == '0':
+                payment.status = 'completed'
+                payment.mpesa_receipt = _receipt(callback_data)
+                payment.paid_at = now
+                order = payment.order
+                if order is not None and order.status == 'pending':
+                    order.status = 'confirmed'
+                    order.updated_at = now
+                    orders.append(order)
+                    history.append(OrderStatusHistory(
+                        order=order,
+                        status='confirmed',
+                        notes=f'Payment completed via M-Pesa. Receipt: {payment.mpesa_receipt}'
+                    ))
+            else:
+                payment.status = 'failed'
+                payment.failure_reason = callback_data.get('ResultDesc', 'Payment failed')
+
+        Payment.objects.bulk_update(
+            payments,
+            ['status', 'mpesa_receipt', 'paid_at', 'failure_reason', 'gateway_response', 'updated_at']
+        )
+        Order.objects.bulk_update(orders, ['status', 'updated_at'])
+        OrderStatusHistory.objects.bulk_create(history)
+
+    return len(payments)
+
+
+def drain_mpesa_callbacks(batch_size=200):
+    """
+    Apply queued callbacks in batches; returns the number of payments settled.
+
+    Raises QueueBusy if another drain is running.
+    """
+
+    settled = 0
+    # A slot still being written is skipped after one retry; its payment is
+    # then left to reconcile_mpesa_payments
+    for checkout_ids in callback_queue.consume(batch_size):
+        saved = Payment.objects.filter(
+            transaction_id__in=checkout_ids, status__in=UNSETTLED_STATUSES
+        ).values_list('transaction_id', 'gateway_response')
+        settled += apply_mpesa_results({cid: response for cid, response in saved if _is_result(response)})
+    return settled
+
+
+def _query_status(client, checkout_request_id):
+    try:
+        return checkout_request_id, client.stk_query(checkout_request_id)
+    except MpesaError:
+        return checkout_request_id, None
+
+
+def reconcile_mpesa_payments(older_than=timedelta(minutes=2), chunk_size=100, max_workers=8, client=None):
+    """
+    Settle M-Pesa payments still unsettled after ``older_than``.
+
+    Payments are read in id-ordered chunks. A payment that already holds a
+    callback result is settled from it; the rest are queried concurrently
+    with at most ``max_workers`` requests in flight. Results are applied in
+    bulk, and transactions Daraja is still processing are left for the next
+    run. Returns (checked, settled).
+    """
+
+    client = client or get_mpesa_client()
+    cutoff = timezone.now() - older_than
+    pending = Payment.objects.filter(
+        payment_method='mpesa',
+        status__in=UNSETTLED_STATUSES,
+        created_at__lt=cutoff,
+        transaction_id__isnull=False,
+    ).exclude(transaction_id='').order_by('id')
+
+    checked = settled = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            chunk = list(
+                pending.filter(id__gt=last_id).values_list('id', 'transaction_id', 'gateway_response')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            checked += len(chunk)
+
+            results = {cid: response for _, cid, response in chunk if _is_result(response)}
+            unanswered = [cid for _, cid, _ in chunk if cid not in results]
+            responses = pool.map(lambda cid: _query_status(client, cid), unanswered)
+            # Only responses carrying a ResultCode are final; in-progress
+            # queries come back with an errorCode instead
+            results.update((cid, response) for cid, response in responses if _is_result(response))
+            settled += apply_mpesa_results(results)
+
+    return checked, settled
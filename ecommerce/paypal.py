@@ -0,0 +1,157 @@
+"""
+Mukurugenzi E-commerce Platform - PayPal Client
+One configured paypalrestsdk Api per process, with shared token and pooled connections
+
+``paypalrestsdk.configure`` on every request made each payment fetch a new
+OAuth token over a new connection. ``get_paypal_api`` builds the Api once:
+its token is reused until shortly before expiry and shared with the other
+workers through the cache, its calls go through a keep-alive
+``requests.Session`` with timeouts, and each call's latency is logged and
+kept in ``metrics``.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import paypalrestsdk
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from paypalrestsdk import exceptions
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_KEY = 'paypal:token'
+TOKEN_EXPIRY_MARGIN = 120  # stop sharing a token this many seconds before expiry
+
+DEFAULT_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+
+_RESOURCE_ID = re.compile(r'^\d+$|^(?=.*\d)[A-Za-z0-9-]{8,}$')
+
+
+def _call_name(method, url):
+    """'POST /v1/payments/payment/{id}/execute' style label for a request"""
+    path = url.split('://', 1)[-1].split('?', 1)[0].split('/')[1:]
+    segments = ['{id}' if _RESOURCE_ID.match(segment) else segment for segment in path]
+    return f"{method} /{'/'.join(segments)}"
+
+
+class GatewayMetrics:
+    """Per-call latency counters for one process"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            stats = self._calls.setdefault(name, {
+                'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'recent': deque(maxlen=self.window)
+            })
+            stats['count'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['recent'].append(seconds)
+
+    def snapshot(self):
+        """{call: {count, errors, avg_ms, p95_ms, max_ms}}"""
+        with self._lock:
+            result = {}
+            for name, stats in self._calls.items():
+                recent = sorted(stats['recent'])
+                result[name] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(stats['total'] / stats['count'] * 1000, 1),
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+                    'max_ms': round(stats['max'] * 1000, 1),
+                }
+            return result
+
+
+class PayPalApi(paypalrestsdk.Api):
+    """paypalrestsdk.Api with a pooled session, a shared token and call metrics"""
+
+    def __init__(self, options=None, timeout=DEFAULT_TIMEOUT, pool_size=10, **kwargs):
+        super().__init__(options, **kwargs)
+        self.timeout = timeout
+        self.metrics = GatewayMetrics()
+        self._token_lock = threading.Lock()
+
+        # Retry only failed connects; a resent payment call could double-charge
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_token_hash(self, authorization_code=None, refresh_token=None, headers=None):
+        if authorization_code is not None or refresh_token is not None:
+            return super().get_token_hash(authorization_code, refresh_token, headers=headers)
+
+        with self._token_lock:
+            self.validate_token_hash()
+            if self.token_hash is None:
+                cached = cache.get(TOKEN_CACHE_KEY)
+                if cached:
+                    self.token_hash, self.token_request_at = cached
+                    self.validate_token_hash()
+            if self.token_hash is not None:
+                return self.token_hash
+
+            token = super().get_token_hash(headers=headers)
+            ttl = int(token.get('expires_in', 0)) - TOKEN_EXPIRY_MARGIN
+            if ttl > 0:
+                cache.set(TOKEN_CACHE_KEY, (token, self.token_request_at), ttl)
+            return token
+
+    def http_call(self, url, method, **kwargs):
+        name = _call_name(method, url)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, proxies=self.proxies, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.metrics.record(name, time.perf_counter() - started, ok=False)
+            logger.warning('PayPal %s failed after %.0fms', name, (time.perf_counter() - started) * 1000)
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.metrics.record(name, elapsed, ok=response.status_code < 400)
+        logger.info('PayPal %s -> %s in %.0fms (debug id %s)', name, response.status_code,
+                    elapsed * 1000, response.headers.get('PayPal-Debug-Id', '-'))
+
+        try:
+            return self.handle_response(response, response.content.decode('utf-8'))
+        except exceptions.UnauthorizedAccess:
+            # Token revoked early: stop sharing it so the SDK's retry fetches a new one
+            if kwargs.get('headers', {}).get('Authorization', '').startswith('Bearer'):
+                cache.delete(TOKEN_CACHE_KEY)
+            raise
+
+
+_api = None
+_api_lock = threading.Lock()
+
+
+def get_paypal_api():
+    """Process-wide PayPalApi built from settings"""
+
+    global _api
+    if _api is None:
+        with _api_lock:
+            if _api is None:
+                _api = PayPalApi(
+                    mode=settings.PAYPAL_MODE,  # sandbox or live
+                    client_id=settings.PAYPAL_CLIENT_ID,
+                    client_secret=settings.PAYPAL_CLIENT_SECRET,
+                    timeout=getattr(settings, 'PAYPAL_TIMEOUT', DEFAULT_TIMEOUT),
+                )
+    return _api
@@ -0,0 +1,85 @@
+"""
+Mukurugenzi E-commerce Platform - Cache-Backed Work Queues
+Append-only queues on the shared cache, drained in batches by one worker at a time
+
+Producers take a slot number from an atomic counter and write their item
+into that slot. The consumer walks the slots from its cursor, and the cursor
+only moves past a batch after the caller has finished processing it, so an
+exception leaves the batch to be picked up again by the next drain. A drain
+started while another is running raises QueueBusy, so the caller can try
+again later rather than leave newly queued items waiting.
+"""
+
+from django.core.cache import cache
+
+
+class QueueBusy(Exception):
+    """Another worker is draining the queue"""
+
+
+class CacheQueue:
+
+    def __init__(self, name, timeout=7 * 24 * 60 * 60, lock_timeout=5 * 60):
+        self.name = name
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.sequence_key = f'{name}:seq'
+        self.cursor_key = f'{name}:cursor'
+        self.gap_key = f'{name}:gap'
+        self.lock_key = f'{name}:draining'
+
+    def _slot_key(self, slot):
+        return f'{self.name}:slot:{slot}'
+
+    def push(self, item):
+        try:
+            slot = cache.incr(self.sequence_key)
+        except ValueError:
+            cache.add(self.sequence_key, 0, None)
+            slot = cache.incr(self.sequence_key)
+        cache.set(self._slot_key(slot), item, self.timeout)
+        return slot
+
+    def __len__(self):
+        return cache.get(self.sequence_key, 0) - cache.get(self.cursor_key, 0)
+
+    def consume(self, batch_size=200):
+        """
+        Yield lists of up to ``batch_size`` items. Raises QueueBusy if
+        another worker is already draining.
+
+        A slot that is still empty (its producer has not written it yet) stops
+        the drain once, and is skipped if it is still empty on the next drain.
+        """
+
+        if not cache.add(self.lock_key, 1, self.lock_timeout):
+            raise QueueBusy(self.name)
+
+        try:
+            cursor = cache.get(self.cursor_key, 0)
+            last = cache.get(self.sequence_key, 0)
+            while cursor < last:
+                slots = range(cursor + 1, min(cursor + batch_size, last) + 1)
+                stored = cache.get_many([self._slot_key(slot) for slot in slots])
+
+                items, end = [], cursor
+                for slot in slots:
+                    item = stored.get(self._slot_key(slot))
+                    if item is None and cache.get(self.gap_key) != slot:
+                        cache.set(self.gap_key, slot, self.timeout)
+                        break
+                    if item is not None:
+                        items.append(item)
+                    end = slot
+
+                if items:
+                    yield items
+
+                cursor = end
+                cache.set(self.cursor_key, cursor, None)
+                cache.delete_many([self._slot_key(slot) for slot in slots if slot <= cursor])
+
+                if cursor < slots[-1]:
+                    break  # stopped at a gap
+        finally:
+            cache.delete(self.lock_key)
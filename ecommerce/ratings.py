@@ -0,0 +1,149 @@
+"""
+Mukurugenzi E-commerce Platform - Product Rating Summaries
+Denormalized per-product review statistics (count, sum, average, star histogram)
+
+Each product keeps one counter per star value in the cache. Counters are
+adjusted incrementally as approved reviews come and go (see signals.py) and
+rebuilt from the reviews table in a single grouped query when missing.
+"""
+
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import ProductReview
+
+
+RATING_STARS = (1, 2, 3, 4, 5)
+
+RATING_VERSION_KEY = 'rating:{}:version'
+RATING_STAR_KEY = 'rating:{}:{}:{}'
+RATING_TIMEOUT = 24 * 60 * 60  # bounds the life of a counter that drifted
+
+
+class RatingSummary:
+    """Read-only view over a product's star histogram"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.count = sum(histogram.values())
+        self.total = sum(star * n for star, n in histogram.items())
+        self.average = round(self.total / self.count, 1) if self.count else 0
+
+    def __repr__(self):
+        return f"<RatingSummary count={self.count} average={self.average}>"
+
+
+# Counters are stored under a per-product version, as the cart totals are.
+# Invalidating a product moves it to a new version, so a rebuild that read
+# the reviews before a change writes to the abandoned version and can never
+# overwrite newer counters. Rebuilds also only add missing counters.
+
+def _versions(product_ids):
+    """Map product id -> current counter version, starting one where missing"""
+
+    keys = {RATING_VERSION_KEY.format(pid): pid for pid in product_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, pid in keys.items():
+        if pid not in versions:
+            version = uuid.uuid4().hex
+            cache.add(key, version, None)
+            versions[pid] = cache.get(key, version)
+    return versions
+
+
+# ============================================================================
+# READS
+# ============================================================================
+
+def refresh_rating_summaries(product_ids):
+    """Rebuild the star histograms of the given products from approved reviews"""
+
+    product_ids = set(product_ids)
+    versions = _versions(product_ids)  # before reading, so a concurrent change wins
+    histograms = {pid: dict.fromkeys(RATING_STARS, 0) for pid in product_ids}
+
+    rows = ProductReview.objects.filter(
+        product_id__in=product_ids,
+        is_approved=True
+    ).values('product_id', 'rating').annotate(n=Count('id'))
+    for row in rows:
+        histograms[row['product_id']][int(row['rating'])] = row['n']
+
+    for pid, histogram in histograms.items():
+        for star, n in histogram.items():
+            cache.add(RATING_STAR_KEY.format(pid, versions[pid], star), n, RATING_TIMEOUT)
+    return histograms
+
+
+def get_rating_summaries(product_ids):
+    """Map product id -> RatingSummary with two cache round trips"""
+
+    versions = _versions(set(product_ids))
+    keys = [RATING_STAR_KEY.format(pid, version, star) for pid, version in versions.items() for star in RATING_STARS]
+    cached = cache.get_many(keys)
+
+    histograms = {}
+    missing = []
+    for pid, version in versions.items():
+        histogram = {star: cached.get(RATING_STAR_KEY.format(pid, version, star)) for star in RATING_STARS}
+        if None in histogram.values():
+            missing.append(pid)
+        else:
+            histograms[pid] = histogram
+
+    if missing:
+        histograms.update(refresh_rating_summaries(missing))
+
+    return {pid: RatingSummary(histogram) for pid, histogram in histograms.items()}
+
+
+def attach_rating_summaries(products):
+    """Set ``rating_summary`` on each product for template rendering"""
+
+    products = list(products)
+    summaries = get_rating_summaries(product.id for product in products)
+    for product in products:
+        product.rating_summary = summaries[product.id]
+    return products
+
+
+# ============================================================================
+# INCREMENTAL UPDATES
+# ============================================================================
+
+def _adjust(product_id, star, delta):
+    """Bump one star counter; returns False if the histogram was invalidated"""
+    version = _versions([product_id])[product_id]
+    try:
+        cache.incr(RATING_STAR_KEY.format(product_id, version, star), delta)
+        return True
+    except ValueError:
+        # Counter expired or never built: retire this version so that a
+        # rebuild already in flight cannot store counts missing this change
+        invalidate_rating_summaries([product_id])
+        return False
+
+
+def invalidate_rating_summaries(product_ids):
+    """Move products to a fresh version; the next read rebuilds their histograms"""
+    cache.set_many({RATING_VERSION_KEY.format(pid): uuid.uuid4().hex for pid in product_ids}, None)
+
+
+def record_review_change(old, new):
+    """
+    Apply a review transition to the histograms.
+
+    ``old`` and ``new`` are ``(product_id, rating)`` pairs for the approved
+    state before and after the change, or None when the review was not
+    counted (unapproved, newly created or deleted).
+    """
+
+    if old == new:
+        return
+    rebuilt = set()
+    if old is not None and not _adjust(old[0], int(old[1]), -1):
+        rebuilt.add(old[0])
+    if new is not None and new[0] not in rebuilt:
+        _adjust(new[0], int(new[1]), 1)
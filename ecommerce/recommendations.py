@@ -0,0 +1,124 @@
+"""
+Mukurugenzi E-commerce Platform - Co-purchase Recommendations
+"Customers also bought" neighbours computed offline from order history
+
+``build_recommendations`` (run by the management command of the same name)
+turns OrderItem history into a sparse order x product matrix, multiplies it
+by its transpose to get item-item co-occurrence counts, and keeps the top-N
+neighbours of every product in a small JSON file. Web processes only read
+that file, so serving related products is one dictionary lookup plus a
+primary-key query.
+"""
+
+import json
+import os
+import threading
+
+from django.conf import settings
+
+from .models import OrderItem
+
+
+TOP_N_NEIGHBOURS = 12
+
+_lock = threading.Lock()
+_loaded = {'mtime': None, 'neighbours': {}}
+
+
+def recommendations_path():
+    return getattr(
+        settings,
+        'RECOMMENDATIONS_PATH',
+        os.path.join(settings.BASE_DIR, 'data', 'recommendations.json')
+    )
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+def _neighbours():
+    """Neighbour table from disk, reloaded only when the file changes"""
+    path = recommendations_path()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+
+    if _loaded['mtime'] != mtime:
+        with _lock:
+            if _loaded['mtime'] != mtime:
+                with open(path) as fh:
+                    data = json.load(fh)
+                _loaded['neighbours'] = {int(pid): ids for pid, ids in data['neighbours'].items()}
+                _loaded['mtime'] = mtime
+    return _loaded['neighbours']
+
+
+def get_related_product_ids(product_id, limit=4):
+    """Most co-purchased product ids for ``product_id``, best first"""
+    return _neighbours().get(product_id, [])[:limit]
+
+
+# ============================================================================
+# OFFLINE BUILD
+# ============================================================================
+
+def build_recommendations(top_n=TOP_N_NEIGHBOURS, path=None):
+    """
+    Rebuild the neighbour file from order history.
+
+    Scores are cosine-normalized co-occurrence counts, so best-sellers do not
+    crowd out every other product's neighbour list. Returns the number of
+    products that received neighbours.
+    """
+
+    import numpy as np
+    from scipy import sparse
+
+    pairs = np.array(
+        list(
+            OrderItem.objects.filter(
+                product_variant__isnull=False
+            ).values_list('order_id', 'product_variant__product_id').distinct().iterator(chunk_size=5000)
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+    neighbours = {}
+    if len(pairs):
+        order_ids, order_index = np.unique(pairs[:, 0], return_inverse=True)
+        product_ids, product_index = np.unique(pairs[:, 1], return_inverse=True)
+
+        purchases = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (order_index, product_index)),
+            shape=(len(order_ids), len(product_ids))
+        )
+        co_occurrence = (purchases.T @ purchases).tocsr()
+        co_occurrence.setdiag(0)
+        co_occurrence.eliminate_zeros()
+
+        popularity = np.sqrt(np.asarray(purchases.sum(axis=0)).ravel())
+        scaling = sparse.diags(1.0 / popularity)
+        scores = (scaling @ co_occurrence @ scaling).tocsr()
+
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            if start == end:
+                continue
+            columns = scores.indices[start:end]
+            values = scores.data[start:end]
+            if len(values) > top_n:
+                keep = np.argpartition(-values, top_n)[:top_n]
+                columns, values = columns[keep], values[keep]
+            ranked = columns[np.argsort(-values, kind='stable')]
+            neighbours[str(product_ids[row])] = product_ids[ranked].tolist()
+
+    path = path or recommendations_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump({'top_n': top_n, 'neighbours': neighbours}, fh, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+    return len(neighbours)
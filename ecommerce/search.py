@@ -0,0 +1,248 @@
+"""
+Mukurugenzi E-commerce Platform - Product Search
+Ranked full-text search over the product catalog
+
+PostgreSQL uses a weighted tsvector expression backed by a GIN index
+(created by the ``build_search_index`` management command). Other databases
+fall back to an in-process inverted index that is kept current from the
+Product save/delete signals.
+"""
+
+import re
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+SEARCH_CONFIG = 'english'
+
+# Kept in one place so the query matches the GIN index expression exactly
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('{config}', coalesce(\"ecommerce_product\".\"name\", '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce(\"ecommerce_product\".\"sku\", '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce(\"ecommerce_product\".\"description\", '')), 'B')"
+).format(config=SEARCH_CONFIG)
+
+SEARCH_INDEX_NAME = 'ecommerce_product_search_idx'
+
+SEARCH_INDEX_VERSION_KEY = 'search:index_version'
+
+# Upper bound on fallback hits handed back to the ORM as an id list
+SEARCH_RESULT_LIMIT = 1000
+
+# Field weights for the in-process index, mirroring the tsvector weights
+FIELD_WEIGHTS = {'name': 3, 'sku': 3, 'description': 1}
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def looks_like_sku(query):
+    """SKUs are a single token with no spaces"""
+    return bool(query) and ' ' not in query.strip()
+
+
+# ============================================================================
+# IN-PROCESS INVERTED INDEX (non-PostgreSQL fallback)
+# ============================================================================
+
+class InvertedIndex:
+    """Token -> {product_id: weight} postings for active products"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}  # product_id -> tokens, for removal
+        self.version = None
+        self.lock = threading.Lock()
+
+    def _add(self, product_id, fields):
+        weights = defaultdict(int)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                weights[token] += weight
+        for token, weight in weights.items():
+            self.postings[token][product_id] = weight
+        self.documents[product_id] = list(weights)
+
+    def _remove(self, product_id):
+        for token in self.documents.pop(product_id, ()):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def load(self, rows, version):
+        """Replace the index contents with ``rows`` (dicts with id + FIELD_WEIGHTS keys)"""
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.documents = {}
+            for row in rows:
+                self._add(row['id'], row)
+            self.version = version
+
+    def rebuild(self, version):
+        rows = Product.objects.filter(is_active=True).values('id', *FIELD_WEIGHTS).iterator(chunk_size=2000)
+        self.load(rows, version)
+
+    def update(self, product, version):
+        with self.lock:
+            self._remove(product.id)
+            if product.is_active:
+                self._add(product.id, {field: getattr(product, field) for field in FIELD_WEIGHTS})
+            self.version = version
+
+    def remove(self, product_id, version):
+        with self.lock:
+            self._remove(product_id)
+            self.version = version
+
+    def search(self, query):
+        """Product ids matching every query token, best score first"""
+
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            # Intersect from the rarest token to keep candidate sets small
+            postings = sorted((self.postings.get(token, {}) for token in set(tokens)), key=len)
+            if not postings[0]:
+                return []
+            scores = dict(postings[0])
+            for posting in postings[1:]:
+                scores = {pid: score + posting[pid] for pid, score in scores.items() if pid in posting}
+                if not scores:
+                    return []
+        return sorted(scores, key=lambda pid: (-scores[pid], pid))
+
+
+_index = InvertedIndex()
+
+
+def _current_version():
+    version = cache.get(SEARCH_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(SEARCH_INDEX_VERSION_KEY, 1, None)
+        version = cache.get(SEARCH_INDEX_VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    try:
+        return cache.incr(SEARCH_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(SEARCH_INDEX_VERSION_KEY, 1, None)
+        return 1
+
+
+def get_inverted_index():
+    """The process-local index, rebuilt if another process changed the catalog"""
+    version = _current_version()
+    if _index.version != version:
+        _index.rebuild(version)
+    return _index
+
+
+def index_product(product):
+    """Keep the fallback index current after a product is saved"""
+    if connection.vendor == 'postgresql':
+        return
+    up_to_date = _index.version is not None and _index.version == _current_version()
+    version = _bump_version()
+    if up_to_date:
+        _index.update(product, version)
+
+
+def unindex_product(product_id):
+    if connection.vendor == 'postgresql':
+        return
+    up_to_date = _index.version is not None and _index.version == _current_version()
+    version = _bump_version()
+    if up_to_date:
+        _index.remove(product_id, version)
+
+
+def invalidate_search_index():
+    """Make every process rebuild its fallback index, after writes that skip signals"""
+    if connection.vendor != 'postgresql':
+        _bump_version()
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def _filtered_hits(queryset, product_ids):
+    """
+    The first SEARCH_RESULT_LIMIT ranked ids that are also in ``queryset``.
+
+    Filters are applied before the limit, so a narrow category or brand
+    still finds matches ranked below the first SEARCH_RESULT_LIMIT overall.
+    """
+
+    hits = []
+    for start in range(0, len(product_ids), SEARCH_RESULT_LIMIT):
+        chunk = product_ids[start:start + SEARCH_RESULT_LIMIT]
+        allowed = set(queryset.filter(id__in=chunk).values_list('id', flat=True))
+        hits.extend(pid for pid in chunk if pid in allowed)
+        if len(hits) >= SEARCH_RESULT_LIMIT:
+            return hits[:SEARCH_RESULT_LIMIT]
+    return hits
+
+
+def search_products(queryset, query):
+    """
+    Filter ``queryset`` down to products matching ``query``.
+
+    Apply any other filters to ``queryset`` first. Returns
+    ``(queryset, ranked)``; when ``ranked`` is True the queryset is already
+    ordered by relevance, with an exact SKU match first.
+    """
+
+    query = query.strip()
+    if not query:
+        return queryset, False
+
+    if connection.vendor == 'postgresql':
+        match = Q(RawSQL(
+            f"({SEARCH_VECTOR_SQL}) @@ websearch_to_tsquery(%s, %s)",
+            (SEARCH_CONFIG, query),
+            output_field=BooleanField()
+        ))
+        queryset = queryset.annotate(search_rank=RawSQL(
+            f"ts_rank_cd({SEARCH_VECTOR_SQL}, websearch_to_tsquery(%s, %s))",
+            (SEARCH_CONFIG, query),
+            output_field=FloatField()
+        ))
+        ordering = ['-search_rank', '-id']
+    else:
+        product_ids = _filtered_hits(queryset, get_inverted_index().search(query))
+        if not product_ids and not looks_like_sku(query):
+            return queryset.none(), False
+        match = Q(id__in=product_ids)
+        queryset = queryset.annotate(search_rank=Case(
+            *[When(id=pid, then=position) for position, pid in enumerate(product_ids)],
+            default=len(product_ids),
+            output_field=IntegerField()
+        ))
+        ordering = ['search_rank', '-id']
+
+    # Exact SKU hits are matched in the same query and rank first
+    if looks_like_sku(query):
+        sku_match = Q(sku=query)
+        queryset = queryset.annotate(
+            sku_rank=Case(When(sku_match, then=0), default=1, output_field=IntegerField())
+        )
+        match |= sku_match
+        ordering.insert(0, 'sku_rank')
+
+    return queryset.filter(match).order_by(*ordering), True
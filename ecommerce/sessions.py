@@ -0,0 +1,69 @@
+"""
+Mukurugenzi E-commerce Platform - Session Engine
+Cache-first sessions with lazy database persistence
+
+Every session write goes to the cache. The database row is written at most
+once per SESSION_DB_PERSIST_INTERVAL for each session, so busy carts and
+one-request visitors (bots, bounces) cost no database writes. Reads come
+from the cache and fall back to the database after an eviction or restart.
+That fallback can be at most one interval behind the cache. Set the interval
+to 0 to write through on every save.
+
+Needs a cache shared by all workers (the Redis cache in production). Enable
+it with ``SESSION_ENGINE = 'ecommerce.sessions'``, and run
+``purge_expired_sessions`` on a schedule to trim django_session.
+"""
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import router
+
+
+PERSIST_KEY_PREFIX = 'ecommerce.sessions.persisted:'
+
+
+def persist_interval():
+    return getattr(settings, 'SESSION_DB_PERSIST_INTERVAL', 5 * 60)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'ecommerce.sessions:'
+
+    @property
+    def persist_key(self):
+        return PERSIST_KEY_PREFIX + self._get_or_create_session_key()
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        expiry = self.get_expiry_age()
+
+        if must_create:
+            # The cache add claims the key atomically; exists() has already
+            # ruled out a clash with rows persisted earlier
+            if not self._cache.add(self.cache_key, data, expiry):
+                raise CreateError
+            if persist_interval():
+                self._cache.set(self.persist_key, 1, persist_interval())
+                return
+        else:
+            self._cache.set(self.cache_key, data, expiry)
+
+        if not persist_interval() or self._cache.add(self.persist_key, 1, persist_interval()):
+            self._persist(data)
+
+    def _persist(self, data):
+        """Write the row with UPDATE, falling back to INSERT for cache-only sessions"""
+        obj = self.create_model_instance(data)
+        obj.save(using=router.db_for_write(self.model, instance=obj))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        super().delete(session_key)
+        self._cache.delete(PERSIST_KEY_PREFIX + session_key)
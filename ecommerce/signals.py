@@ -0,0 +1,191 @@
+"""
+Mukurugenzi E-commerce Platform - Signal Handlers
+Keeps cached catalog data in sync with model changes
+"""
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_homepage_blocks
+from .cart import adjust_cart_totals, invalidate_cart_totals
+from .categories import invalidate_category_tree
+from .delivery import invalidate_delivery_table
+from .facets import invalidate_facets
+from .models import (
+    Banner, CartItem, Category, County, DeliveryStation, InternationalShippingZone,
+    Product, ProductImage, ProductReview, ProductVariant, Video
+)
+from .ratings import record_review_change
+from .search import index_product, unindex_product
+
+
+# ============================================================================
+# HOMEPAGE CACHE INVALIDATION
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=Banner)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Video)
+def invalidate_homepage_cache(sender, **kwargs):
+    """Drop homepage blocks built from the changed model"""
+    invalidate_homepage_blocks(sender.__name__)
+
+
+# ============================================================================
+# PRODUCT RATING SUMMARIES
+# ============================================================================
+
+def _counted_rating(review):
+    """The (product, rating) pair a review contributes, if it is approved"""
+    if review.is_approved:
+        return (review.product_id, review.rating)
+    return None
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_state(sender, instance, **kwargs):
+    """Capture the stored approval/rating so post_save can diff against it"""
+    previous = None
+    if instance.pk:
+        previous = ProductReview.objects.filter(pk=instance.pk).values(
+            'product_id', 'rating', 'is_approved'
+        ).first()
+    if previous and previous['is_approved']:
+        instance._previous_rating = (previous['product_id'], previous['rating'])
+    else:
+        instance._previous_rating = None
+
+
+# The star counters outlive a rolled-back transaction, so only apply committed changes
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_summary_on_save(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        record_review_change, getattr(instance, '_previous_rating', None), _counted_rating(instance)
+    ))
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_summary_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(record_review_change, _counted_rating(instance), None))
+
+
+# ============================================================================
+# PRODUCT SEARCH INDEX
+# ============================================================================
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_product(instance.id)
+
+
+# ============================================================================
+# PRODUCT FACETS
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_facet_cache(sender, **kwargs):
+    invalidate_facets()
+
+
+# ============================================================================
+# CATEGORY TREE
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_tree_cache(sender, **kwargs):
+    invalidate_category_tree()
+
+
+# ============================================================================
+# STORED CART TOTALS
+# ============================================================================
+
+# Like the star counters, the cart counters are only moved once the change is
+# committed: a rolled-back checkout or merge must leave them untouched, and an
+# early invalidation would let a rebuild store the pre-commit totals
+
+@receiver(pre_save, sender=CartItem)
+def remember_cart_item_state(sender, instance, **kwargs):
+    instance._previous_line = None
+    if instance.pk:
+        instance._previous_line = CartItem.objects.filter(pk=instance.pk).values(
+            'cart_id', 'quantity', 'product_variant__price'
+        ).first()
+
+
+@receiver(post_save, sender=CartItem)
+def update_cart_totals_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_line', None)
+    if previous and previous['cart_id'] != instance.cart_id:
+        transaction.on_commit(partial(
+            adjust_cart_totals,
+            previous['cart_id'],
+            -previous['quantity'],
+            -previous['quantity'] * previous['product_variant__price']
+        ))
+        previous = None
+
+    old_quantity = previous['quantity'] if previous else 0
+    old_amount = old_quantity * previous['product_variant__price'] if previous else 0
+    price = instance.product_variant.price
+    transaction.on_commit(partial(
+        adjust_cart_totals,
+        instance.cart_id,
+        instance.quantity - old_quantity,
+        instance.quantity * price - old_amount
+    ))
+
+
+@receiver(post_delete, sender=CartItem)
+def update_cart_totals_on_delete(sender, instance, **kwargs):
+    if not CartItem.product_variant.is_cached(instance):
+        # Bulk/cascade deletes: avoid a variant query per row
+        transaction.on_commit(partial(invalidate_cart_totals, [instance.cart_id]))
+        return
+    transaction.on_commit(partial(
+        adjust_cart_totals,
+        instance.cart_id,
+        -instance.quantity,
+        -instance.quantity * instance.product_variant.price
+    ))
+
+
+@receiver(pre_save, sender=ProductVariant)
+def remember_variant_price(sender, instance, **kwargs):
+    instance._previous_price = None
+    if instance.pk:
+        instance._previous_price = ProductVariant.objects.filter(pk=instance.pk).values_list(
+            'price', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=ProductVariant)
+def invalidate_cart_totals_on_price_change(sender, instance, created, **kwargs):
+    """Stored subtotals embed the old price, so rebuild affected carts lazily"""
+    if not created and getattr(instance, '_previous_price', None) != instance.price:
+        cart_ids = list(
+            CartItem.objects.filter(product_variant=instance).values_list('cart_id', flat=True).distinct()
+        )
+        transaction.on_commit(partial(invalidate_cart_totals, cart_ids))
+
+
+# ============================================================================
+# DELIVERY LOOKUP TABLE
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=County)
+@receiver([post_save, post_delete], sender=DeliveryStation)
+@receiver([post_save, post_delete], sender=InternationalShippingZone)
+def invalidate_delivery_table_cache(sender, **kwargs):
+    invalidate_delivery_table()
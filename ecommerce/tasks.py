@@ -0,0 +1,213 @@
+"""
+Mukurugenzi E-commerce Platform - Celery Tasks
+Gateway calls, payment settlement, email and housekeeping, kept off the request thread
+"""
+
+import time
+
+import paypalrestsdk
+from celery import shared_task
+from django.core.cache import cache
+from django.urls import reverse
+
+from .currency import convert, refresh_exchange_rates
+from .emails import OUTBOX_BATCH_DELAY, OUTBOX_FLUSH_SCHEDULED_KEY, flush_outbox
+from .inventory import release_expired_holds
+from .models import Order, Payment
+from .mpesa import MpesaError, get_mpesa_client
+from .paypal import get_paypal_api
+from .payments import (
+    CALLBACK_BATCH_DELAY, CALLBACK_DRAIN_SCHEDULED_KEY, FAILED, SUCCEEDED,
+    drain_mpesa_callbacks, finish_attempt, reconcile_mpesa_payments
+)
+from .queues import QueueBusy
+
+
+# ============================================================================
+# M-PESA
+# ============================================================================
+
+@shared_task(ignore_result=True)
+def initiate_mpesa_payment(attempt_id, order_id, phone_number):
+    """Send the STK push for ``order_id`` and record the Payment"""
+
+    order = Order.objects.filter(id=order_id, status='pending').first()
+    if order is None:
+        finish_attempt(attempt_id, FAILED, 'Order is no longer awaiting payment')
+        return
+
+    try:
+        response_data = get_mpesa_client().stk_push(
+            phone_number,
+            order.total_amount,
+            account_reference=order.order_number,
+            description=f"Payment for Order {order.order_number}"
+        )
+    except MpesaError as e:
+        finish_attempt(attempt_id, FAILED, f'Error initiating payment: {e}')
+        return
+
+    if response_data.get('ResponseCode') == '0':
+        Payment.objects.create(
+            order=order,
+            user_id=order.user_id,
+            payment_method='mpesa',
+            amount=order.total_amount,
+            currency='KES',
+            status='processing',
+            transaction_id=response_data.get('CheckoutRequestID'),
+            mpesa_phone=phone_number,
+            gateway_response=response_data
+        )
+        finish_attempt(
+            attempt_id, SUCCEEDED,
+            'Payment request sent. Please check your phone to complete payment.',
+            reverse('order_confirmation', kwargs={'order_id': order.id})
+        )
+    else:
+        finish_attempt(
+            attempt_id, FAILED,
+            f"Payment initiation failed: {response_data.get('errorMessage', 'Unknown error')}"
+        )
+
+
+@shared_task(ignore_result=True)
+def process_mpesa_callbacks():
+    """Apply every queued STK callback in batches"""
+    try:
+        drain_mpesa_callbacks()
+    except QueueBusy:
+        # Callbacks queued behind the running drain may be past its end
+        process_mpesa_callbacks.apply_async(countdown=CALLBACK_BATCH_DELAY)
+
+
+@shared_task(ignore_result=True)
+def reconcile_pending_mpesa_payments():
+    """Settle payments whose callback was lost (run by celery beat)"""
+    reconcile_mpesa_payments()
+
+
+def schedule_callback_drain():
+    """Queue one drain per burst of callbacks rather than one per callback"""
+    if cache.add(CALLBACK_DRAIN_SCHEDULED_KEY, 1, CALLBACK_BATCH_DELAY):
+        try:
+            process_mpesa_callbacks.apply_async(countdown=CALLBACK_BATCH_DELAY)
+        except Exception:
+            cache.delete(CALLBACK_DRAIN_SCHEDULED_KEY)  # let the next callback try again
+            raise
+
+
+# ============================================================================
+# CURRENCY
+# ============================================================================
+
+@shared_task(ignore_result=True)
+def refresh_currency_rates():
+    """Reload exchange rates for every process (run by celery beat)"""
+    _, retry_at = refresh_exchange_rates()
+    if retry_at is not None:
+        # Back off and retry sooner than the next beat run
+        refresh_currency_rates.apply_async(countdown=max(retry_at - time.time(), 1))
+
+
+# ============================================================================
+# INVENTORY
+# ============================================================================
+
+@shared_task(ignore_result=True)
+def release_expired_stock_holds():
+    """Compact expired checkout holds (run by celery beat)"""
+    release_expired_holds()
+
+
+# ============================================================================
+# PAYPAL
+# ============================================================================
+
+@shared_task(ignore_result=True)
+def create_paypal_payment(attempt_id, order_id, return_url, cancel_url):
+    """Create the PayPal payment for ``order_id`` and publish its approval URL"""
+
+    order = Order.objects.filter(id=order_id, status='pending').first()
+    if order is None:
+        finish_attempt(attempt_id, FAILED, 'Order is no longer awaiting payment')
+        return
+
+    amount_usd = convert(order.total_amount, 'USD')
+
+    payment = paypalrestsdk.Payment({
+        "intent": "sale",
+        "payer": {
+            "payment_method": "paypal"
+        },
+        "redirect_urls": {
+            "return_url": return_url,
+            "cancel_url": cancel_url
+        },
+        "transactions": [{
+            "item_list": {
+                "items": [{
+                    "name": f"Order {order.order_number}",
+                    "sku": order.order_number,
+                    "price": f"{amount_usd:.2f}",
+                    "currency": "USD",
+                    "quantity": 1
+                }]
+            },
+            "amount": {
+                "total": f"{amount_usd:.2f}",
+                "currency": "USD"
+            },
+            "description": f"Payment for Order {order.order_number}"
+        }]
+    }, api=get_paypal_api())
+
+    try:
+        created = payment.create()
+    except Exception as e:
+        finish_attempt(attempt_id, FAILED, f'Error creating PayPal payment: {e}')
+        return
+
+    if not created:
+        finish_attempt(attempt_id, FAILED, f"PayPal payment creation failed: {payment.error}")
+        return
+
+    Payment.objects.create(
+        order=order,
+        user_id=order.user_id,
+        payment_method='paypal',
+        amount=order.total_amount,
+        currency='USD',
+        status='processing',
+        paypal_transaction_id=payment.id,
+        gateway_response={'payment_id': payment.id}
+    )
+
+    approval_url = next((link.href for link in payment.links if link.rel == "approval_url"), None)
+    if approval_url:
+        finish_attempt(attempt_id, SUCCEEDED, redirect_url=approval_url)
+    else:
+        finish_attempt(attempt_id, FAILED, 'PayPal did not return an approval link')
+
+
+# ============================================================================
+# EMAIL
+# ============================================================================
+
+@shared_task(ignore_result=True)
+def send_queued_emails():
+    """Send the email outbox over one SMTP connection"""
+    sent, retry_at = flush_outbox()
+    if retry_at is not None:
+        # Deferred retries are due, or another flush held the outbox
+        send_queued_emails.apply_async(countdown=max(retry_at - time.time(), 1))
+
+
+def schedule_outbox_flush():
+    """Queue one flush per burst of emails rather than one per email"""
+    if cache.add(OUTBOX_FLUSH_SCHEDULED_KEY, 1, OUTBOX_BATCH_DELAY):
+        try:
+            send_queued_emails.apply_async(countdown=OUTBOX_BATCH_DELAY)
+        except Exception:
+            cache.delete(OUTBOX_FLUSH_SCHEDULED_KEY)
+            raise
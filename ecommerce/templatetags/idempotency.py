@@ -0,0 +1,16 @@
+import uuid
+
+from django import template
+from django.utils.html import format_html
+
+from ecommerce.idempotency import IDEMPOTENCY_FIELD
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_key():
+    """
+    Hidden input carrying a fresh idempotency key for the enclosing form
+    """
+    return format_html('<input type="hidden" name="{}" value="{}">', IDEMPOTENCY_FIELD, uuid.uuid4().hex)
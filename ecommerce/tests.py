@@ -1,3 +1,339 @@
-from django.test import TestCase
+"""
+Mukurugenzi E-commerce Platform - Tests
+"""
 
-# Create your tests here.
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+
+from . import tasks
+from .emails import flush_outbox, outbox, queue_email
+from .idempotency import idempotent, retryable
+from .inventory import InsufficientStockError
+from .models import (
+    Brand, Cart, CartItem, Category, County, DeliveryStation, Order, OrderItem, Product, ProductVariant, User,
+    Video, VideoEpisode, VideoGenre, VideoSeason
+)
+from .orders import held_quantities, place_order_from_cart
+
+
+def make_category(name='Clothing', **fields):
+    return Category.objects.create(name=name, slug=slugify(name), **fields)
+
+
+def make_variant(name='Classic Shirt', price='1000.00', stock_quantity=10, category=None, **product_fields):
+    product = Product.objects.create(
+        name=name,
+        slug=slugify(name),
+        sku=slugify(name).upper(),
+        product_type='clothing',
+        category=category or make_category(f'{name} Category'),
+        base_price=Decimal(price),
+        **product_fields
+    )
+    return ProductVariant.objects.create(
+        product=product,
+        sku=f'{product.sku}-V',
+        price=Decimal(price),
+        stock_quantity=stock_quantity
+    )
+
+
+# ============================================================================
+# ORDER PLACEMENT
+# ============================================================================
+
+class PlaceOrderConcurrencyTests(TransactionTestCase):
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_last_unit_is_sold_exactly_once(self):
+        variant = make_variant(stock_quantity=1)
+        buyers = []
+        for n in range(2):
+            user = User.objects.create_user(f'buyer{n}', f'buyer{n}@example.com', 'secret')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=1)
+            buyers.append((user, cart))
+
+        # Widen the window between locking the stock and decrementing it, so
+        # the second checkout arrives while the first still holds the row
+        def slow_held_quantities(*args, **kwargs):
+            time.sleep(0.2)
+            return held_quantities(*args, **kwargs)
+
+        barrier = threading.Barrier(len(buyers))
+        outcomes = []
+
+        def checkout(user, cart):
+            try:
+                barrier.wait()
+                try:
+                    outcomes.append(place_order_from_cart(cart, user, Decimal('0')))
+                except InsufficientStockError as e:
+                    outcomes.append(e)
+            finally:
+                connection.close()
+
+        with mock.patch('ecommerce.orders.held_quantities', slow_held_quantities):
+            threads = [threading.Thread(target=checkout, args=buyer) for buyer in buyers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len([o for o in outcomes if isinstance(o, Order)]), 1)
+        self.assertEqual(len([o for o in outcomes if isinstance(o, InsufficientStockError)]), 1)
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.filter(product_variant=variant).count(), 1)
+
+
+# ============================================================================
+# EMAIL OUTBOX
+# ============================================================================
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'outbox-tests'}},
+)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(tasks.send_queued_emails, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queued_on_commit_and_sent_by_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_email('Order confirmed', 'Thanks', ['buyer@example.com'])
+            self.assertEqual(len(outbox), 0)
+
+        self.assertEqual(len(outbox), 1)
+        self.apply_async.assert_called_once()  # one flush scheduled for the burst
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(flush_outbox(), (1, None))
+        self.assertEqual([m.subject for m in mail.outbox], ['Order confirmed'])
+        self.assertEqual(len(outbox), 0)
+
+    def test_rolled_back_request_sends_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    queue_email('Order confirmed', 'Thanks', ['buyer@example.com'])
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(len(outbox), 0)
+        self.apply_async.assert_not_called()
+
+    def test_failed_send_is_deferred_with_backoff(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_email('Order confirmed', 'Thanks', ['buyer@example.com'])
+
+        smtp = mock.Mock()
+        smtp.send_messages.side_effect = OSError('connection reset')
+        sent, retry_at = flush_outbox(connection=smtp)
+
+        self.assertEqual(sent, 0)
+        self.assertGreater(retry_at, time.time())
+        self.assertEqual(len(outbox), 1)
+
+    def test_busy_outbox_reschedules_the_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_email('Order confirmed', 'Thanks', ['buyer@example.com'])
+        self.apply_async.reset_mock()
+
+        cache.add(outbox.lock_key, 1)  # another worker is flushing
+        tasks.send_queued_emails()
+
+        self.assertEqual(mail.outbox, [])
+        self.apply_async.assert_called_once()
+
+        cache.delete(outbox.lock_key)
+        tasks.send_queued_emails.run()
+        self.assertEqual(len(mail.outbox), 1)
+
+
+# ============================================================================
+# IDEMPOTENCY KEYS
+# ============================================================================
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'idempotency-tests'}},
+)
+class IdempotencyTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def post(self, view):
+        request = RequestFactory().post('/orders/place/', {'idempotency_key': 'form-token'})
+        request.user = mock.Mock(is_authenticated=True, pk=1)
+        return view(request)
+
+    def test_success_is_replayed(self):
+        @idempotent('test')
+        def view(request):
+            self.calls += 1
+            return redirect('/orders/1/')
+
+        first, second = self.post(view), self.post(view)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replay'], 'true')
+
+    def test_rejected_request_runs_again(self):
+        @idempotent('test')
+        def view(request):
+            self.calls += 1
+            if self.calls == 1:
+                return retryable(redirect('/cart/'))
+            return redirect('/orders/1/')
+
+        self.post(view)
+        self.assertEqual(self.post(view)['Location'], '/orders/1/')
+        self.assertEqual(self.calls, 2)
+
+    def test_client_errors_are_not_stored(self):
+        @idempotent('test')
+        def view(request):
+            self.calls += 1
+            return HttpResponse(status=400)
+
+        self.post(view)
+        self.assertNotIn('Idempotent-Replay', self.post(view))
+        self.assertEqual(self.calls, 2)
+
+
+# ============================================================================
+# ADMIN CHANGELISTS
+# ============================================================================
+
+class AdminChangelistQueryTests(TestCase):
+    """Count columns come from one annotated query, not a query per row"""
+
+    ROWS = 4
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+
+    def assertChangelistQueriesFlat(self, model, add_row):
+        """The changelist runs as many queries for ROWS rows as for one"""
+
+        url = reverse(f'admin:ecommerce_{model._meta.model_name}_changelist')
+        add_row(0)
+        self.client.get(url)  # warm up sessions and content types
+        with CaptureQueriesContext(connection) as one_row:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        for n in range(1, self.ROWS):
+            add_row(n)
+        with self.assertNumQueries(len(one_row)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_category_changelist(self):
+        parent = make_category('Fashion')
+
+        def add_row(n):
+            category = make_category(f'Shirts {n}', parent=parent)
+            for i in range(n + 1):
+                make_variant(f'Shirt {n}-{i}', category=category)
+
+        response = self.assertChangelistQueriesFlat(Category, add_row)
+        counts = {c.name: c._product_count for c in response.context['cl'].result_list}
+        self.assertEqual(counts['Shirts 3'], 4)
+
+    def test_brand_changelist(self):
+        def add_row(n):
+            brand = Brand.objects.create(name=f'Brand {n}', slug=f'brand-{n}')
+            for i in range(n + 1):
+                make_variant(f'Branded {n}-{i}', brand=brand)
+
+        response = self.assertChangelistQueriesFlat(Brand, add_row)
+        counts = {b.name: b._product_count for b in response.context['cl'].result_list}
+        self.assertEqual(counts, {'Brand 0': 1, 'Brand 1': 2, 'Brand 2': 3, 'Brand 3': 4})
+
+    def test_county_changelist(self):
+        def add_row(n):
+            county = County.objects.create(name=f'County {n}', code=f'{n:03}', slug=f'county-{n}')
+            for i in range(n + 1):
+                DeliveryStation.objects.create(
+                    county=county, name=f'Station {n}-{i}', slug=f'station-{n}-{i}', address='Main Street'
+                )
+
+        response = self.assertChangelistQueriesFlat(County, add_row)
+        counts = {c.name: c._station_count for c in response.context['cl'].result_list}
+        self.assertEqual(counts, {'County 0': 1, 'County 1': 2, 'County 2': 3, 'County 3': 4})
+
+    def test_product_changelist(self):
+        category = make_category()
+        brand = Brand.objects.create(name='House', slug='house')
+
+        def add_row(n):
+            variant = make_variant(f'Trouser {n}', category=category, brand=brand)
+            for i in range(n):
+                ProductVariant.objects.create(
+                    product=variant.product, sku=f'{variant.sku}-{i}', price=variant.price, stock_quantity=1
+                )
+
+        response = self.assertChangelistQueriesFlat(Product, add_row)
+        counts = {p.name: p._variant_count for p in response.context['cl'].result_list}
+        self.assertEqual(counts, {'Trouser 0': 1, 'Trouser 1': 2, 'Trouser 2': 3, 'Trouser 3': 4})
+
+    def test_video_genre_changelist(self):
+        def add_row(n):
+            genre = VideoGenre.objects.create(name=f'Genre {n}', slug=f'genre-{n}')
+            for i in range(n + 1):
+                Video.objects.create(title=f'Film {n}-{i}', slug=f'film-{n}-{i}').genres.add(genre)
+
+        response = self.assertChangelistQueriesFlat(VideoGenre, add_row)
+        counts = {g.name: g._video_count for g in response.context['cl'].result_list}
+        self.assertEqual(counts, {'Genre 0': 1, 'Genre 1': 2, 'Genre 2': 3, 'Genre 3': 4})
+
+    def test_video_season_changelist(self):
+        def add_row(n):
+            video = Video.objects.create(title=f'Series {n}', slug=f'series-{n}')
+            season = VideoSeason.objects.create(video=video, season_number=1, title=f'Season {n}')
+            for i in range(n + 1):
+                VideoEpisode.objects.create(
+                    season=season, episode_number=i + 1, title=f'Episode {n}-{i}', slug=f'episode-{n}-{i}'
+                )
+
+        response = self.assertChangelistQueriesFlat(VideoSeason, add_row)
+        counts = {s.title: s._episode_count for s in response.context['cl'].result_list}
+        self.assertEqual(counts, {'Season 0': 1, 'Season 1': 2, 'Season 2': 3, 'Season 3': 4})
+
+    def test_cart_changelist(self):
+        variant = make_variant(price='250.00')
+
+        def add_row(n):
+            user = User.objects.create_user(f'shopper{n}', f'shopper{n}@example.com', 'secret')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=n + 1)
+            Cart.objects.create(session_key=f'guest-session-{n}')
+
+        response = self.assertChangelistQueriesFlat(Cart, add_row)
+        totals = {
+            c.user.username: (c._total_items, c._subtotal)
+            for c in response.context['cl'].result_list if c.user_id
+        }
+        self.assertEqual(totals['shopper3'], (4, Decimal('1000.00')))
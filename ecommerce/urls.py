@@ -14,6 +14,7 @@ urlpatterns = [
     path('products/', views.products, name='products'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
     path('api/get-variant-details/', views.get_variant_details, name='get_variant_details'),
+    path('api/get-variant-details/batch/', views.get_variant_details_batch, name='get_variant_details_batch'),
     
     # ============================================================================
     # CART
@@ -46,6 +47,12 @@ urlpatterns = [
     path('payment/paypal/<int:order_id>/execute/', views.paypal_execute, name='paypal_execute'),
     path('payment/paypal/<int:order_id>/cancel/', views.paypal_cancel, name='paypal_cancel'),
     
+    # ============================================================================
+    # PAYMENTS - STATUS
+    # ============================================================================
+    path('payment/pending/<str:attempt_id>/', views.payment_pending, name='payment_pending'),
+    path('payment/status/<str:attempt_id>/', views.payment_status, name='payment_status'),
+    
     # ============================================================================
     # ORDER MANAGEMENT
     # ============================================================================
@@ -0,0 +1,80 @@
+"""
+Mukurugenzi E-commerce Platform - Product Variants
+Compact size x colour variant matrix for product pages and batched lookups
+"""
+
+from .inventory import available_to_sell
+from .models import ProductVariant
+
+
+# Largest number of (product, size, color) tuples accepted per batch request
+MAX_VARIANT_BATCH = 100
+
+
+def variant_key(size_id, color_id):
+    """Matrix key; missing size/colour is encoded as an empty string"""
+    return f"{size_id or ''}:{color_id or ''}"
+
+
+def serialize_variant(variant, available=None):
+    """``available`` is the sellable stock (see inventory.available_to_sell)"""
+    if available is None:
+        available = variant.stock_quantity
+    return {
+        'variant_id': variant.id,
+        'sku': variant.sku,
+        'price': str(variant.price),
+        'compare_at_price': str(variant.compare_at_price) if variant.compare_at_price else None,
+        'stock_quantity': max(available, 0),
+        'is_in_stock': variant.is_in_stock and available > 0,
+        'is_low_stock': variant.is_low_stock,
+        'variant_image': variant.variant_image.url if variant.variant_image else None,
+    }
+
+
+def build_variant_matrix(variants):
+    """
+    Build the product page variant data from already-loaded variants.
+
+    Returns ``(sizes, colors, matrix)`` where sizes/colors are the distinct
+    options in display order and matrix maps ``variant_key`` to the
+    serialized variant, so the page can resolve selections client-side.
+    """
+
+    variants = list(variants)
+    available = available_to_sell(variants)  # stock minus checkout holds
+    sizes, colors, matrix = {}, {}, {}
+    for variant in variants:
+        if variant.size_id:
+            sizes[variant.size_id] = variant.size
+        if variant.color_id:
+            colors[variant.color_id] = variant.color
+        matrix[variant_key(variant.size_id, variant.color_id)] = serialize_variant(variant, available[variant.id])
+
+    sizes = sorted(sizes.values(), key=lambda size: (size.order, size.id))
+    colors = sorted(colors.values(), key=lambda color: color.id)
+    return sizes, colors, matrix
+
+
+def lookup_variants(items):
+    """
+    Resolve many ``{'product_id', 'size_id', 'color_id'}`` selections in one query.
+
+    Returns a list aligned with ``items``; unmatched selections are None.
+    """
+
+    wanted = [
+        (str(item.get('product_id')), variant_key(item.get('size_id'), item.get('color_id')))
+        for item in items
+    ]
+    product_ids = {product_id for product_id, _ in wanted}
+
+    found = {}
+    for variant in ProductVariant.objects.filter(product_id__in=product_ids, is_active=True):
+        found[(str(variant.product_id), variant_key(variant.size_id, variant.color_id))] = variant
+
+    available = available_to_sell(found.values())
+    return [
+        serialize_variant(found[key], available[found[key].id]) if key in found else None
+        for key in wanted
+    ]
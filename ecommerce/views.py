@@ -7,8 +7,8 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, Avg, Min, Max, Prefetch
-from django.http import JsonResponse, HttpResponse
+from django.db.models import Count, Min, Max, Prefetch
+from django.http import JsonResponse, HttpResponse, Http404
 from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -16,12 +16,31 @@ from django.core.paginator import Paginator
 from django.urls import reverse
 from decimal import Decimal
 import json
-import requests
-import base64
 from django.db.models import Sum
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from .models import *
+from .cache import get_homepage_blocks
+from .ratings import attach_rating_summaries, get_rating_summaries
+from .search import search_products
+from .facets import get_facets
+from .pagination import cursor_paginate
+from .categories import get_category_tree
+from .currency import attach_display_prices, convert, display_currency
+from .recommendations import get_related_product_ids
+from .cart import SessionCart, get_cart, get_cart_count, get_cart_totals, merge_anonymous_cart
+from .delivery import get_delivery_table
+from .emails import queue_email
+from .idempotency import idempotent, retryable
+from .mpesa import format_phone_number, is_valid_phone_number
+from .inventory import InsufficientStockError, available_to_sell, reserve_cart
+from .orders import place_order_from_cart
+from .paypal import get_paypal_api
+from .payments import (
+    FAILED, PENDING, SUCCEEDED, PaymentNotFound, get_attempt, queue_mpesa_callback, start_attempt
+)
+from .tasks import create_paypal_payment, initiate_mpesa_payment, schedule_callback_drain
+from .variants import MAX_VARIANT_BATCH, build_variant_matrix, lookup_variants, serialize_variant
 
 
 # ============================================================================
@@ -31,63 +50,25 @@ from .models import *
 def index(request):
     """Homepage with featured products and videos"""
     
-    # Get active banners
-    banners = Banner.objects.filter(
-        is_active=True,
-        start_date__lte=timezone.now()
-    ).filter(
-        Q(end_date__isnull=True) | Q(end_date__gte=timezone.now())
-    ).order_by('order')[:5]
-    
-    # Featured products
-    featured_products = Product.objects.filter(
-        is_active=True,
-        is_featured=True
-    ).select_related('category', 'brand').prefetch_related(
-        'images',
-        Prefetch('reviews', queryset=ProductReview.objects.filter(is_approved=True))
-    )[:8]
-    
-    # New arrivals (last 30 days)
-    new_products = Product.objects.filter(
-        is_active=True,
-        created_at__gte=timezone.now() - timedelta(days=30)
-    ).select_related('category', 'brand').prefetch_related('images').order_by('-created_at')[:12]
-    
-    # If not enough new products, get latest products
-    if new_products.count() < 12:
-        new_products = Product.objects.filter(
-            is_active=True
-        ).select_related('category', 'brand').prefetch_related('images').order_by('-created_at')[:12]
-    
-    # Featured videos
-    featured_videos = Video.objects.filter(
-        is_active=True,
-        is_featured=True
-    ).prefetch_related('genres')[:6]
+    # Catalog blocks come from the cache and are rebuilt only after edits
+    context = get_homepage_blocks()
+    attach_rating_summaries(context['featured_products'] + context['new_products'])
     
-    # Get categories (parent categories only)
-    categories = Category.objects.filter(
-        is_active=True,
-        parent__isnull=True
-    ).prefetch_related('subcategories')[:5]
+    # Prices in the shopper's currency, one rate lookup for the whole page
+    currency = display_currency(request.user)
+    attach_display_prices(context['featured_products'] + context['new_products'], currency)
     
     # Calculate date 7 days ago for "New" badge
     today_minus_7 = timezone.now() - timedelta(days=7)
     
-    # Get cart count for current user
-    cart = get_or_create_cart(request)
-    cart_count = cart.total_items if cart else 0
+    # Get cart count for current user (never creates a cart)
+    cart_count = get_cart_count(request)
     
-    context = {
-        'banners': banners,
-        'featured_products': featured_products,
-        'new_products': new_products,
-        'featured_videos': featured_videos,
-        'categories': categories,
+    context.update({
         'today_minus_7': today_minus_7,
         'cart_count': cart_count,
-    }
+        'display_currency': currency,
+    })
     
     return render(request, 'store/index.html', context)
 
@@ -103,24 +84,19 @@ def products(request):
         Prefetch('variants', queryset=ProductVariant.objects.filter(is_active=True))
     )
     
-    # Search
-    search_query = request.GET.get('q', '')
-    if search_query:
-        products_list = products_list.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(sku__icontains=search_query)
-        )
-    
     # Category filter
+    category_tree = get_category_tree()
     category_slug = request.GET.get('category', '')
     selected_category = None
+    category_breadcrumbs = []
     if category_slug:
-        selected_category = get_object_or_404(Category, slug=category_slug, is_active=True)
-        # Get category and all its subcategories
-        category_ids = [selected_category.id]
-        category_ids.extend(selected_category.subcategories.values_list('id', flat=True))
+        selected_category = category_tree.get_active(category_slug)
+        if selected_category is None:
+            raise Http404('Category not found')
+        # Category plus all of its descendants, at any depth
+        category_ids = category_tree.descendant_ids(selected_category.id)
         products_list = products_list.filter(category_id__in=category_ids)
+        category_breadcrumbs = category_tree.breadcrumbs(selected_category.id)
     
     # Brand filter
     brand_slug = request.GET.get('brand', '')
@@ -142,42 +118,60 @@ def products(request):
     if product_type:
         products_list = products_list.filter(product_type=product_type)
     
-    # Sorting
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'price_low':
-        products_list = products_list.order_by('base_price')
-    elif sort_by == 'price_high':
-        products_list = products_list.order_by('-base_price')
-    elif sort_by == 'name':
-        products_list = products_list.order_by('name')
-    else:  # newest
-        products_list = products_list.order_by('-created_at')
-    
-    # Pagination
-    paginator = Paginator(products_list, 12)  # 12 products per page
-    page_number = request.GET.get('page', 1)
-    products_page = paginator.get_page(page_number)
+    # Search, after the filters so ranked hits are drawn from the filtered set
+    search_query = request.GET.get('q', '')
+    products_list, ranked = search_products(products_list, search_query)
+    
+    # Sidebar counts for the current filter set
+    facets = get_facets(products_list, request.GET)
+    
+    # Sorting (search results default to relevance order)
+    sort_by = request.GET.get('sort', 'relevance' if ranked else 'newest')
+    sort_fields = {
+        'price_low': 'base_price',
+        'price_high': '-base_price',
+        'name': 'name',
+        'newest': '-created_at',
+    }
+    sort_field = None if (sort_by == 'relevance' and ranked) else sort_fields.get(sort_by, '-created_at')
+    
+    # Pagination: keyset cursors for sorted listings, page numbers for
+    # relevance-ranked results and legacy ?page= links
+    if sort_field and 'page' not in request.GET:
+        products_page = cursor_paginate(products_list, sort_field, request.GET.get('cursor'), per_page=12)
+    else:
+        if sort_field:
+            products_list = products_list.order_by(sort_field, 'id')
+        paginator = Paginator(products_list, 12)  # 12 products per page
+        page_number = request.GET.get('page', 1)
+        products_page = paginator.get_page(page_number)
+    
+    currency = display_currency(request.user)
+    attach_display_prices(products_page, currency)
+    attach_rating_summaries(products_page)
     
     # Get all categories and brands for filters
-    all_categories = Category.objects.filter(is_active=True, parent__isnull=True)
+    all_categories = category_tree.menu()
     all_brands = Brand.objects.filter(is_active=True)
     
     # Get cart count
-    cart = get_or_create_cart(request)
-    cart_count = cart.total_items if cart else 0
+    cart_count = get_cart_count(request)
     
     context = {
         'products': products_page,
         'categories': all_categories,
         'brands': all_brands,
         'selected_category': selected_category,
+        'category_breadcrumbs': category_breadcrumbs,
         'selected_brand': selected_brand,
         'search_query': search_query,
         'sort_by': sort_by,
         'min_price': min_price,
         'max_price': max_price,
         'product_type': product_type,
+        'facets': facets,
         'cart_count': cart_count,
+        'display_currency': currency,
     }
     
     return render(request, 'store/products.html', context)
@@ -196,37 +190,39 @@ def product_detail(request, slug):
         is_active=True
     )
     
-    # Get available sizes and colors
-    available_sizes = Size.objects.filter(
-        productvariant__product=product,
-        productvariant__is_active=True
-    ).distinct().order_by('order')
-    
-    available_colors = Color.objects.filter(
-        productvariant__product=product,
-        productvariant__is_active=True
-    ).distinct()
+    # Sizes, colours and the full variant matrix from the prefetched variants
+    available_sizes, available_colors, variant_matrix = build_variant_matrix(product.variants.all())
     
     # Get reviews
     reviews = product.reviews.filter(is_approved=True).select_related('user').prefetch_related('images')
-    average_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    rating_summary = get_rating_summaries([product.id])[product.id]
     
-    # Related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id).prefetch_related('images')[:4]
+    # Related products: co-purchase neighbours, else the same category
+    related_ids = get_related_product_ids(product.id)
+    if related_ids:
+        related_by_id = Product.objects.filter(
+            id__in=related_ids,
+            is_active=True
+        ).prefetch_related('images').in_bulk()
+        related_products = [related_by_id[pid] for pid in related_ids if pid in related_by_id]
+    else:
+        related_products = Product.objects.filter(
+            category=product.category,
+            is_active=True
+        ).exclude(id=product.id).prefetch_related('images')[:4]
     
     # Get cart count
-    cart = get_or_create_cart(request)
-    cart_count = cart.total_items if cart else 0
+    cart_count = get_cart_count(request)
     
     context = {
         'product': product,
         'available_sizes': available_sizes,
         'available_colors': available_colors,
+        'variant_matrix': variant_matrix,
         'reviews': reviews,
-        'average_rating': average_rating,
+        'average_rating': rating_summary.average,
+        'rating_summary': rating_summary,
+        'category_breadcrumbs': get_category_tree().breadcrumbs(product.category_id),
         'related_products': related_products,
         'cart_count': cart_count,
     }
@@ -252,17 +248,8 @@ def get_variant_details(request):
         ).first()
         
         if variant:
-            return JsonResponse({
-                'success': True,
-                'variant_id': variant.id,
-                'sku': variant.sku,
-                'price': str(variant.price),
-                'compare_at_price': str(variant.compare_at_price) if variant.compare_at_price else None,
-                'stock_quantity': variant.stock_quantity,
-                'is_in_stock': variant.is_in_stock,
-                'is_low_stock': variant.is_low_stock,
-                'variant_image': variant.variant_image.url if variant.variant_image else None,
-            })
+            available = available_to_sell([variant])[variant.id]
+            return JsonResponse({'success': True, **serialize_variant(variant, available)})
         else:
             return JsonResponse({
                 'success': False,
@@ -276,24 +263,41 @@ def get_variant_details(request):
         }, status=400)
 
 
+@require_POST
+def get_variant_details_batch(request):
+    """AJAX endpoint resolving many (product, size, color) selections at once"""
+    
+    try:
+        data = json.loads(request.body)
+        items = data.get('items', [])
+        
+        if not isinstance(items, list) or len(items) > MAX_VARIANT_BATCH:
+            return JsonResponse({
+                'success': False,
+                'message': f'Send a list of at most {MAX_VARIANT_BATCH} items'
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'variants': lookup_variants(items),
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+
+
 # ============================================================================
 # CART VIEWS
 # ============================================================================
 
 
 def get_or_create_cart(request):
-    """Helper function to get or create cart for user or session"""
-    
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
+    """Helper function to get the cart, persisting it for logged-in users"""
     
-    return cart
+    return get_cart(request, create=True)
 
 
 @require_POST
@@ -320,31 +324,42 @@ def add_to_cart(request):
                 'message': f'Only {variant.stock_quantity} items available in stock'
             }, status=400)
         
+        # First add is the point where a cart gets persisted
         cart = get_or_create_cart(request)
         
-        # Check if item already in cart
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product_variant=variant,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            # Update quantity
-            new_quantity = cart_item.quantity + quantity
+        if isinstance(cart, SessionCart):
+            new_quantity = cart.get_quantity(variant.id) + quantity
             if new_quantity > variant.stock_quantity:
                 return JsonResponse({
                     'success': False,
                     'message': f'Cannot add more. Only {variant.stock_quantity} items available'
                 }, status=400)
-            cart_item.quantity = new_quantity
-            cart_item.save()
-        
+            cart.set_quantity(variant.id, new_quantity)
+        else:
+            # Check if item already in cart
+            cart_item, created = CartItem.objects.get_or_create(
+                cart=cart,
+                product_variant=variant,
+                defaults={'quantity': quantity}
+            )
+            
+            if not created:
+                # Update quantity
+                new_quantity = cart_item.quantity + quantity
+                if new_quantity > variant.stock_quantity:
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Cannot add more. Only {variant.stock_quantity} items available'
+                    }, status=400)
+                cart_item.quantity = new_quantity
+                cart_item.save()
+        
+        cart_count, cart_subtotal = get_cart_totals(cart)
         return JsonResponse({
             'success': True,
             'message': 'Item added to cart',
-            'cart_count': cart.total_items,
-            'cart_subtotal': str(cart.subtotal)
+            'cart_count': cart_count,
+            'cart_subtotal': str(cart_subtotal)
         })
         
     except Exception as e:
@@ -370,25 +385,41 @@ def update_cart_item(request):
                 'message': 'Quantity must be at least 1'
             }, status=400)
         
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart = get_cart(request)
+        
+        if isinstance(cart, SessionCart):
+            # Session cart items are keyed by variant id
+            if not cart.get_quantity(item_id):
+                raise Http404('Cart item not found')
+            variant = get_object_or_404(ProductVariant, id=item_id, is_active=True)
+        else:
+            cart_item = get_object_or_404(
+                CartItem.objects.select_related('product_variant'), id=item_id, cart=cart
+            )
+            variant = cart_item.product_variant
         
         # Check stock
-        if quantity > cart_item.product_variant.stock_quantity:
+        if quantity > variant.stock_quantity:
             return JsonResponse({
                 'success': False,
-                'message': f'Only {cart_item.product_variant.stock_quantity} items available'
+                'message': f'Only {variant.stock_quantity} items available'
             }, status=400)
         
-        cart_item.quantity = quantity
-        cart_item.save()
+        if isinstance(cart, SessionCart):
+            cart.set_quantity(variant.id, quantity)
+            item_total = variant.price * quantity
+        else:
+            cart_item.quantity = quantity
+            cart_item.save()
+            item_total = cart_item.total_price
         
+        cart_count, cart_subtotal = get_cart_totals(cart)
         return JsonResponse({
             'success': True,
             'message': 'Cart updated',
-            'item_total': str(cart_item.total_price),
-            'cart_subtotal': str(cart.subtotal),
-            'cart_count': cart.total_items
+            'item_total': str(item_total),
+            'cart_subtotal': str(cart_subtotal),
+            'cart_count': cart_count
         })
         
     except Exception as e:
@@ -406,15 +437,23 @@ def remove_from_cart(request):
         data = json.loads(request.body)
         item_id = data.get('item_id')
         
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        cart_item.delete()
+        cart = get_cart(request)
+        
+        if isinstance(cart, SessionCart):
+            if not cart.remove(item_id):
+                raise Http404('Cart item not found')
+        else:
+            cart_item = get_object_or_404(
+                CartItem.objects.select_related('product_variant'), id=item_id, cart=cart
+            )
+            cart_item.delete()
         
+        cart_count, cart_subtotal = get_cart_totals(cart)
         return JsonResponse({
             'success': True,
             'message': 'Item removed from cart',
-            'cart_count': cart.total_items,
-            'cart_subtotal': str(cart.subtotal)
+            'cart_count': cart_count,
+            'cart_subtotal': str(cart_subtotal)
         })
         
     except Exception as e:
@@ -427,12 +466,17 @@ def remove_from_cart(request):
 def cart(request):
     """View cart"""
     
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.select_related(
-        'product_variant__product',
-        'product_variant__size',
-        'product_variant__color'
-    ).prefetch_related('product_variant__product__images')
+    cart = get_cart(request)
+    if isinstance(cart, SessionCart):
+        cart_items = cart.items
+    elif cart is not None:
+        cart_items = cart.items.select_related(
+            'product_variant__product',
+            'product_variant__size',
+            'product_variant__color'
+        ).prefetch_related('product_variant__product__images')
+    else:
+        cart_items = []
     
     context = {
         'cart': cart,
@@ -447,43 +491,47 @@ def cart(request):
 # ============================================================================
 
 @login_required
+@require_http_methods(['GET', 'POST'])
 def checkout(request):
-    """Checkout page"""
+    """Checkout page; POSTing it (proceed to payment) holds the cart's stock"""
     
     cart = get_or_create_cart(request)
-    cart_items = cart.items.select_related(
+    cart_items = list(cart.items.select_related(
         'product_variant__product',
         'product_variant__size',
         'product_variant__color'
-    )
+    ))
     
-    if not cart_items.exists():
+    if not cart_items:
         messages.warning(request, 'Your cart is empty')
         return redirect('cart')
     
-    # Check stock availability
-    for item in cart_items:
-        if item.quantity > item.product_variant.stock_quantity:
-            messages.error(
-                request,
-                f'{item.product_variant.product.name} has only {item.product_variant.stock_quantity} items in stock'
-            )
+    # Only an explicit POST holds stock, so refreshes and prefetches of the
+    # page do not keep other shoppers out
+    if request.method == 'POST':
+        try:
+            reserve_cart(cart_items, request.user.id)
+        except InsufficientStockError as e:
+            messages.error(request, str(e))
+            return redirect('cart')
+        except TimeoutError:
+            # Another checkout is holding the same items right now
+            messages.error(request, 'Checkout is busy for some of your items, please try again')
             return redirect('cart')
     
-    # Get delivery options
+    # Get delivery options (served from the in-process delivery table)
+    delivery_table = get_delivery_table()
     if request.user.is_international:
-        delivery_options = InternationalShippingZone.objects.filter(is_active=True)
+        delivery_options = delivery_table.zones
     else:
-        counties = County.objects.filter(is_active=True).prefetch_related(
-            Prefetch('delivery_stations', queryset=DeliveryStation.objects.filter(is_active=True))
-        )
-        delivery_options = counties
+        delivery_options = delivery_table.counties
     
     context = {
         'cart': cart,
         'cart_items': cart_items,
         'delivery_options': delivery_options,
         'is_international': request.user.is_international,
+        'stock_held': request.method == 'POST',
     }
     
     return render(request, 'store/checkout.html', context)
@@ -498,22 +546,23 @@ def calculate_delivery_fee(request):
         data = json.loads(request.body)
         is_international = data.get('is_international', False)
         
+        delivery_table = get_delivery_table()
         if is_international:
-            zone_id = data.get('zone_id')
-            zone = get_object_or_404(InternationalShippingZone, id=zone_id, is_active=True)
-            delivery_fee = zone.shipping_cost
+            delivery_fee = delivery_table.zone_fee(data.get('zone_id'))
         else:
-            station_id = data.get('station_id')
-            station = get_object_or_404(DeliveryStation, id=station_id, is_active=True)
-            delivery_fee = station.delivery_fee
+            delivery_fee = delivery_table.station_fee(data.get('station_id'))
+        
+        if delivery_fee is None:
+            raise Http404('Delivery option not found')
         
         cart = get_or_create_cart(request)
-        total = cart.subtotal + delivery_fee
+        cart_count, subtotal = get_cart_totals(cart)
+        total = subtotal + delivery_fee
         
         return JsonResponse({
             'success': True,
             'delivery_fee': str(delivery_fee),
-            'subtotal': str(cart.subtotal),
+            'subtotal': str(subtotal),
             'total': str(total)
         })
         
@@ -526,16 +575,16 @@ def calculate_delivery_fee(request):
 
 @login_required
 @require_POST
+@idempotent('place_order')
 def place_order(request):
     """Process order and initiate payment"""
     
     try:
         cart = get_or_create_cart(request)
-        cart_items = cart.items.select_related('product_variant')
         
-        if not cart_items.exists():
+        if not cart.items.exists():
             messages.error(request, 'Your cart is empty')
-            return redirect('cart')
+            return retryable(redirect('cart'))
         
         # Get form data
         payment_method = request.POST.get('payment_method')
@@ -545,70 +594,46 @@ def place_order(request):
         is_international = request.user.is_international
         delivery_type = 'international' if is_international else 'local'
         
+        delivery_table = get_delivery_table()
         if is_international:
-            zone_id = request.POST.get('shipping_zone')
-            shipping_zone = get_object_or_404(InternationalShippingZone, id=zone_id, is_active=True)
+            shipping_zone = delivery_table.get_zone(request.POST.get('shipping_zone'))
+            if shipping_zone is None:
+                raise Http404('Shipping zone not found')
             delivery_fee = shipping_zone.shipping_cost
             shipping_address = request.POST.get('shipping_address')
             shipping_phone = request.POST.get('shipping_phone')
             
             delivery_station = None
         else:
-            station_id = request.POST.get('delivery_station')
-            delivery_station = get_object_or_404(DeliveryStation, id=station_id, is_active=True)
+            delivery_station = delivery_table.get_station(request.POST.get('delivery_station'))
+            if delivery_station is None:
+                raise Http404('Delivery station not found')
             delivery_fee = delivery_station.delivery_fee
             shipping_zone = None
             shipping_address = delivery_station.address
             shipping_phone = request.user.phone_number
         
-        # Calculate totals
-        subtotal = cart.subtotal
-        total_amount = subtotal + delivery_fee
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            subtotal=subtotal,
-            delivery_fee=delivery_fee,
-            total_amount=total_amount,
-            status='pending',
-            delivery_type=delivery_type,
-            delivery_station=delivery_station,
-            shipping_zone=shipping_zone,
-            shipping_address=shipping_address,
-            shipping_phone=shipping_phone,
-            customer_notes=customer_notes
-        )
-        
-        # Create order items
-        for item in cart_items:
-            variant = item.product_variant
-            
-            # Create order item
-            OrderItem.objects.create(
-                order=order,
-                product_variant=variant,
-                product_name=variant.product.name,
-                variant_details=f"Size: {variant.size.name if variant.size else 'N/A'}, Color: {variant.color.name if variant.color else 'N/A'}",
-                quantity=item.quantity,
-                unit_price=variant.price,
-                total_price=item.total_price
+        # Create the order, its items and the stock decrements in one transaction
+        try:
+            order = place_order_from_cart(
+                cart,
+                request.user,
+                delivery_fee,
+                created_by=request.user,
+                delivery_type=delivery_type,
+                delivery_station=delivery_station,
+                shipping_zone=shipping_zone,
+                shipping_address=shipping_address,
+                shipping_phone=shipping_phone,
+                customer_notes=customer_notes
             )
-            
-            # Reduce stock
-            variant.stock_quantity -= item.quantity
-            variant.save()
+        except InsufficientStockError as e:
+            messages.error(request, str(e))
+            return retryable(redirect('cart'))
         
-        # Create order status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='pending',
-            notes='Order created',
-            created_by=request.user
-        )
-        
-        # Clear cart
-        cart_items.delete()
+        if order is None:
+            messages.error(request, 'Your cart is empty')
+            return retryable(redirect('cart'))
         
         # Redirect to payment based on method
         if payment_method == 'mpesa':
@@ -617,11 +642,11 @@ def place_order(request):
             return redirect('paypal_payment', order_id=order.id)
         else:
             messages.error(request, 'Invalid payment method')
-            return redirect('checkout')
+            return retryable(redirect('checkout'))
             
     except Exception as e:
         messages.error(request, f'Error placing order: {str(e)}')
-        return redirect('checkout')
+        return retryable(redirect('checkout'))
 
 
 # ============================================================================
@@ -643,152 +668,56 @@ def mpesa_payment(request, order_id):
 
 @login_required
 @require_POST
+@idempotent('mpesa_stk_push')
 def initiate_mpesa_stk_push(request, order_id):
     """Initiate M-Pesa STK Push"""
     
+    order = get_object_or_404(Order, id=order_id, user=request.user, status='pending')
+    phone_number = format_phone_number(request.POST.get('phone_number'))
+    if not is_valid_phone_number(phone_number):
+        messages.error(request, 'Enter a valid M-Pesa phone number, e.g. 0712345678')
+        return retryable(redirect('mpesa_payment', order_id=order.id))
+    
+    # The gateway round trip runs in a worker; the browser polls for the result
+    attempt_id = start_attempt(order, request.user, 'mpesa')
     try:
-        order = get_object_or_404(Order, id=order_id, user=request.user, status='pending')
-        phone_number = request.POST.get('phone_number')
-        
-        # Format phone number (remove +254 or 0 and add 254)
-        if phone_number.startswith('+254'):
-            phone_number = phone_number[1:]
-        elif phone_number.startswith('0'):
-            phone_number = '254' + phone_number[1:]
-        elif not phone_number.startswith('254'):
-            phone_number = '254' + phone_number
-        
-        # M-Pesa API credentials (from settings or environment variables)
-        from django.conf import settings
-        
-        consumer_key = settings.MPESA_CONSUMER_KEY
-        consumer_secret = settings.MPESA_CONSUMER_SECRET
-        shortcode = settings.MPESA_SHORTCODE
-        passkey = settings.MPESA_PASSKEY
-        callback_url = settings.MPESA_CALLBACK_URL
-        
-        # Use sandbox or production
-        if settings.MPESA_ENVIRONMENT == 'sandbox':
-            auth_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-            stk_push_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        else:
-            auth_url = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-            stk_push_url = "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        
-        # Get access token
-        auth_response = requests.get(auth_url, auth=(consumer_key, consumer_secret))
-        access_token = auth_response.json().get('access_token')
-        
-        # Prepare STK Push request
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password = base64.b64encode(f"{shortcode}{passkey}{timestamp}".encode()).decode()
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            "BusinessShortCode": shortcode,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": int(order.total_amount),
-            "PartyA": phone_number,
-            "PartyB": shortcode,
-            "PhoneNumber": phone_number,
-            "CallBackURL": callback_url,
-            "AccountReference": order.order_number,
-            "TransactionDesc": f"Payment for Order {order.order_number}"
-        }
-        
-        # Make STK Push request
-        response = requests.post(stk_push_url, json=payload, headers=headers)
-        response_data = response.json()
-        
-        if response_data.get('ResponseCode') == '0':
-            # Create payment record
-            payment = Payment.objects.create(
-                order=order,
-                user=request.user,
-                payment_method='mpesa',
-                amount=order.total_amount,
-                currency='KES',
-                status='processing',
-                transaction_id=response_data.get('CheckoutRequestID'),
-                mpesa_phone=phone_number,
-                gateway_response=response_data
-            )
-            
-            messages.success(request, 'Payment request sent. Please check your phone to complete payment.')
-            return redirect('order_confirmation', order_id=order.id)
-        else:
-            messages.error(request, f"Payment initiation failed: {response_data.get('errorMessage', 'Unknown error')}")
-            return redirect('mpesa_payment', order_id=order.id)
-            
+        initiate_mpesa_payment.delay(attempt_id, order.id, phone_number)
     except Exception as e:
         messages.error(request, f'Error initiating payment: {str(e)}')
-        return redirect('mpesa_payment', order_id=order.id)
+        return retryable(redirect('mpesa_payment', order_id=order.id))
+    
+    return redirect('payment_pending', attempt_id=attempt_id)
 
 
 @csrf_exempt
 @require_POST
 def mpesa_callback(request):
-    """M-Pesa payment callback"""
+    """M-Pesa payment callback: save the result, acknowledge, settle in the background"""
     
     try:
         data = json.loads(request.body)
         callback_data = data.get('Body', {}).get('stkCallback', {})
-        
-        result_code = callback_data.get('ResultCode')
-        checkout_request_id = callback_data.get('CheckoutRequestID')
-        
-        # Find payment
-        payment = Payment.objects.filter(transaction_id=checkout_request_id).first()
-        
-        if not payment:
-            return JsonResponse({"ResultCode": 1, "ResultDesc": "Payment not found"})
-        
-        if result_code == 0:
-            # Payment successful
-            callback_metadata = callback_data.get('CallbackMetadata', {}).get('Item', [])
-            
-            # Extract M-Pesa receipt number
-            mpesa_receipt = None
-            for item in callback_metadata:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    mpesa_receipt = item.get('Value')
-                    break
-            
-            payment.status = 'completed'
-            payment.mpesa_receipt = mpesa_receipt
-            payment.paid_at = timezone.now()
-            payment.gateway_response = callback_data
-            payment.save()
-            
-            # Update order status
-            order = payment.order
-            order.status = 'confirmed'
-            order.save()
-            
-            # Create status history
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='confirmed',
-                notes=f'Payment completed via M-Pesa. Receipt: {mpesa_receipt}'
-            )
-            
-        else:
-            # Payment failed
-            payment.status = 'failed'
-            payment.failure_reason = callback_data.get('ResultDesc', 'Payment failed')
-            payment.gateway_response = callback_data
-            payment.save()
-        
-        return JsonResponse({"ResultCode": 0, "ResultDesc": "Success"})
-        
+    except (ValueError, AttributeError):
+        callback_data = None
+    
+    if not callback_data or not callback_data.get('CheckoutRequestID'):
+        return JsonResponse({"ResultCode": 1, "ResultDesc": "Invalid callback payload"})
+    
+    try:
+        # Safaricom retries slow or failed acks; repeats are already queued
+        queued = queue_mpesa_callback(callback_data)
+    except PaymentNotFound:
+        return JsonResponse({"ResultCode": 1, "ResultDesc": "Payment not found"})
     except Exception as e:
         return JsonResponse({"ResultCode": 1, "ResultDesc": str(e)})
+    
+    if queued:
+        try:
+            schedule_callback_drain()
+        except Exception:
+            pass  # result is saved; the next callback or reconciliation settles it
+    
+    return JsonResponse({"ResultCode": 0, "ResultDesc": "Success"})
 
 
 # ============================================================================
@@ -801,14 +730,9 @@ def paypal_payment(request, order_id):
     
     order = get_object_or_404(Order, id=order_id, user=request.user, status='pending')
     
-    # Convert KES to USD (you should use a real exchange rate API)
-    # For demo purposes, using a fixed rate
-    exchange_rate = 0.0078  # 1 KES = 0.0078 USD (approximate)
-    amount_usd = float(order.total_amount) * exchange_rate
-    
     context = {
         'order': order,
-        'amount_usd': round(amount_usd, 2),
+        'amount_usd': convert(order.total_amount, 'USD'),
     }
     
     return render(request, 'store/paypal_payment.html', context)
@@ -816,78 +740,25 @@ def paypal_payment(request, order_id):
 
 @login_required
 @require_POST
+@idempotent('paypal_create_payment')
 def paypal_create_payment(request, order_id):
     """Create PayPal payment"""
     
+    order = get_object_or_404(Order, id=order_id, user=request.user, status='pending')
+    
+    attempt_id = start_attempt(order, request.user, 'paypal')
     try:
-        from django.conf import settings
-        import paypalrestsdk
-        
-        order = get_object_or_404(Order, id=order_id, user=request.user, status='pending')
-        
-        # Configure PayPal SDK
-        paypalrestsdk.configure({
-            "mode": settings.PAYPAL_MODE,  # sandbox or live
-            "client_id": settings.PAYPAL_CLIENT_ID,
-            "client_secret": settings.PAYPAL_CLIENT_SECRET
-        })
-        
-        # Convert KES to USD
-        exchange_rate = 0.0078
-        amount_usd = float(order.total_amount) * exchange_rate
-        
-        # Create payment
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {
-                "payment_method": "paypal"
-            },
-            "redirect_urls": {
-                "return_url": request.build_absolute_uri(reverse('paypal_execute', kwargs={'order_id': order.id})),
-                "cancel_url": request.build_absolute_uri(reverse('paypal_cancel', kwargs={'order_id': order.id}))
-            },
-            "transactions": [{
-                "item_list": {
-                    "items": [{
-                        "name": f"Order {order.order_number}",
-                        "sku": order.order_number,
-                        "price": f"{amount_usd:.2f}",
-                        "currency": "USD",
-                        "quantity": 1
-                    }]
-                },
-                "amount": {
-                    "total": f"{amount_usd:.2f}",
-                    "currency": "USD"
-                },
-                "description": f"Payment for Order {order.order_number}"
-            }]
-        })
-        
-        if payment.create():
-            # Save payment record
-            Payment.objects.create(
-                order=order,
-                user=request.user,
-                payment_method='paypal',
-                amount=order.total_amount,
-                currency='USD',
-                status='processing',
-                paypal_transaction_id=payment.id,
-                gateway_response={'payment_id': payment.id}
-            )
-            
-            # Redirect to PayPal
-            for link in payment.links:
-                if link.rel == "approval_url":
-                    return redirect(link.href)
-        else:
-            messages.error(request, f"PayPal payment creation failed: {payment.error}")
-            return redirect('paypal_payment', order_id=order.id)
-            
+        create_paypal_payment.delay(
+            attempt_id,
+            order.id,
+            request.build_absolute_uri(reverse('paypal_execute', kwargs={'order_id': order.id})),
+            request.build_absolute_uri(reverse('paypal_cancel', kwargs={'order_id': order.id}))
+        )
     except Exception as e:
         messages.error(request, f'Error creating PayPal payment: {str(e)}')
-        return redirect('paypal_payment', order_id=order.id)
+        return retryable(redirect('paypal_payment', order_id=order.id))
+    
+    return redirect('payment_pending', attempt_id=attempt_id)
 
 
 @login_required
@@ -896,21 +767,14 @@ def paypal_execute(request, order_id):
     
     try:
         import paypalrestsdk
-        from django.conf import settings
         
         order = get_object_or_404(Order, id=order_id, user=request.user)
         
         payment_id = request.GET.get('paymentId')
         payer_id = request.GET.get('PayerID')
         
-        # Configure PayPal SDK
-        paypalrestsdk.configure({
-            "mode": settings.PAYPAL_MODE,
-            "client_id": settings.PAYPAL_CLIENT_ID,
-            "client_secret": settings.PAYPAL_CLIENT_SECRET
-        })
-        
-        payment = paypalrestsdk.Payment.find(payment_id)
+        # Shared client: configured once, token and connections reused
+        payment = paypalrestsdk.Payment.find(payment_id, api=get_paypal_api())
         
         if payment.execute({"payer_id": payer_id}):
             # Payment successful
@@ -955,6 +819,53 @@ def paypal_cancel(request, order_id):
     return redirect('paypal_payment', order_id=order.id)
 
 
+# ============================================================================
+# PAYMENT STATUS
+# ============================================================================
+
+@login_required
+def payment_pending(request, attempt_id):
+    """Waiting page that polls payment_status until the gateway call finishes"""
+    
+    attempt = get_attempt(attempt_id, request.user)
+    if attempt is None:
+        raise Http404('Payment attempt not found')
+    
+    context = {
+        'attempt_id': attempt_id,
+        'order': get_object_or_404(Order, id=attempt['order_id'], user=request.user),
+        'status_url': reverse('payment_status', kwargs={'attempt_id': attempt_id}),
+    }
+    
+    return render(request, 'store/payment_pending.html', context)
+
+
+@login_required
+def payment_status(request, attempt_id):
+    """Poll endpoint for a background payment initiation"""
+    
+    attempt = get_attempt(attempt_id, request.user)
+    if attempt is None:
+        return JsonResponse({'success': False, 'message': 'Payment attempt not found'}, status=404)
+    
+    redirect_url = attempt['redirect_url']
+    if attempt['status'] == FAILED:
+        retry_view = 'mpesa_payment' if attempt['method'] == 'mpesa' else 'paypal_payment'
+        redirect_url = reverse(retry_view, kwargs={'order_id': attempt['order_id']})
+    
+    # Flash the outcome once so it shows on the page we redirect to
+    if attempt['status'] != PENDING and attempt['message']:
+        level = messages.SUCCESS if attempt['status'] == SUCCEEDED else messages.ERROR
+        messages.add_message(request, level, attempt['message'])
+    
+    return JsonResponse({
+        'success': True,
+        'status': attempt['status'],
+        'message': attempt['message'],
+        'redirect_url': redirect_url,
+    })
+
+
 # ============================================================================
 # ORDER VIEWS
 # ============================================================================
@@ -982,12 +893,14 @@ def orders(request):
     
     orders_list = Order.objects.filter(
         user=request.user
-    ).select_related('delivery_station', 'shipping_zone').prefetch_related('items').order_by('-created_at')
+    ).select_related('delivery_station', 'shipping_zone').prefetch_related('items')
     
-    # Pagination
-    paginator = Paginator(orders_list, 10)
-    page_number = request.GET.get('page', 1)
-    orders_page = paginator.get_page(page_number)
+    # Pagination (keyset cursors; ?page= kept for old links)
+    if 'page' in request.GET:
+        paginator = Paginator(orders_list.order_by('-created_at', '-id'), 10)
+        orders_page = paginator.get_page(request.GET.get('page'))
+    else:
+        orders_page = cursor_paginate(orders_list, '-created_at', request.GET.get('cursor'), per_page=10)
     
     context = {
         'orders': orders_page,
@@ -1121,42 +1034,17 @@ def user_login(request):
         login_input = request.POST.get('login_input')  # Can be email or username
         password = request.POST.get('password')
         
-        # Try to find user by email or username
-        user = None
-        if '@' in login_input:
-            # Login with email
-            try:
-                user_obj = User.objects.get(email=login_input)
-                user = authenticate(request, username=user_obj.username, password=password)
-            except User.DoesNotExist:
-                pass
-        else:
-            # Login with username
-            user = authenticate(request, username=login_input, password=password)
+        # EmailOrUsernameBackend resolves either form in one query
+        user = authenticate(request, username=login_input, password=password)
         
         if user is not None:
+            # login() rotates the session key, so remember the old one for
+            # carts stored against it
+            previous_session_key = request.session.session_key
             auth_login(request, user)
             
-            # Merge session cart with user cart if exists
-            session_key = request.session.session_key
-            if session_key:
-                session_cart = Cart.objects.filter(session_key=session_key).first()
-                if session_cart:
-                    user_cart, created = Cart.objects.get_or_create(user=user)
-                    
-                    # Move items from session cart to user cart
-                    for item in session_cart.items.all():
-                        user_item, created = CartItem.objects.get_or_create(
-                            cart=user_cart,
-                            product_variant=item.product_variant,
-                            defaults={'quantity': item.quantity}
-                        )
-                        if not created:
-                            user_item.quantity += item.quantity
-                            user_item.save()
-                    
-                    # Delete session cart
-                    session_cart.delete()
+            # Merge the anonymous cart into the user's cart
+            merge_anonymous_cart(request, user, previous_session_key)
             
             messages.success(request, f'Welcome back, {user.first_name or user.username}!')
             
@@ -1191,8 +1079,6 @@ def forgot_password(request):
             from django.contrib.auth.tokens import default_token_generator
             from django.utils.http import urlsafe_base64_encode
             from django.utils.encoding import force_bytes
-            from django.core.mail import send_mail
-            from django.conf import settings
             
             token = default_token_generator.make_token(user)
             uid = urlsafe_base64_encode(force_bytes(user.pk))
@@ -1219,13 +1105,8 @@ Best regards,
 Mukurugenzi Team
             '''
             
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
+            # Sent by the outbox worker, not on the request thread
+            queue_email(subject, message, [email])
             
             messages.success(request, 'Password reset link has been sent to your email')
             return redirect('login')